@@ -0,0 +1,445 @@
+# pantry_tracker/benchmarks/benchmark.py
+#
+# Benchmarks for the HTTP API. A synthetic catalog is seeded into a temporary data directory
+# (PANTRY_DATA_DIR), then each scenario is measured in one or both modes:
+#   client - in-process with the Flask test client, one request at a time (no network or server)
+#   load   - against Gunicorn on a local port, driven by a multi-threaded load generator
+# Latency percentiles and throughput are written to a JSON file, and can be compared with
+# an earlier result file to judge a change:
+#
+#   python benchmarks/benchmark.py --products 10000 --categories 50 --output new.json --baseline old.json
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import logging
+import random
+import socket
+import sqlite3
+import argparse
+import platform
+import itertools
+import tempfile
+import threading
+import subprocess
+import configparser
+import datetime
+import uuid
+import requests
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEBAPP_DIR = os.path.join(REPO_DIR, "webapp")
+sys.path.insert(0, WEBAPP_DIR)
+
+API_KEY = "benchmark-api-key"
+# Nothing listens on the discard port, so thumbnail prefetches fail at once without network access
+PRODUCT_URL = "http://127.0.0.1:9/product.jpg"
+SERVER_START_TIMEOUT = 30  # Seconds to wait for Gunicorn to answer /health
+
+# Read-only scenarios first: category_delete leaves its products behind in "Uncategorized"
+SCENARIOS = ("counts_poll", "products_list", "products_page", "update_count", "product_crud", "category_delete")
+
+
+# -----------------------------
+# Synthetic Catalog
+# -----------------------------
+def product_name(index):
+    return f"Product {index:06d}"
+
+def write_config(data_dir):
+    config = configparser.ConfigParser()
+    config["Settings"] = {"theme": "light", "api_key": API_KEY}
+    config["Backups"] = {"schedule_hours": "0"}  # No scheduled snapshots while measuring
+    with open(os.path.join(data_dir, "config.ini"), "w") as f:
+        config.write(f)
+
+def seed_catalog(db_file, products, categories, seed):
+    """Create the schema and insert the catalog directly, which is much faster than the API."""
+    from migrate import migrate_database
+    migrate_database(db_file)
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_file)
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO categories (id, name) VALUES (?, ?)",
+                [(index, f"Category {index:04d}") for index in range(1, categories + 1)]
+            )
+            conn.executemany(
+                "INSERT INTO products (id, name, url, category_id, barcode) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (index, product_name(index), PRODUCT_URL, index % categories + 1, str(2000000000000 + index))
+                    for index in range(1, products + 1)
+                ]
+            )
+            conn.executemany(
+                "INSERT INTO counts (product_id, count) VALUES (?, ?)",
+                [(index, rng.randint(0, 20)) for index in range(1, products + 1)]
+            )
+    finally:
+        conn.close()
+
+
+# -----------------------------
+# Targets
+# -----------------------------
+class ClientTarget:
+    """Sends requests through the Flask test client of an in-process app."""
+
+    def __init__(self):
+        import app as pantry_app  # Imported late so PANTRY_DATA_DIR is already set
+        logging.getLogger().setLevel(logging.WARNING)  # Debug logging would dominate the timings
+        self.client = pantry_app.app.test_client()
+
+    def request(self, method, path, json=None, data=None, content_type=None):
+        response = self.client.open(
+            path, method=method, json=json, data=data, content_type=content_type,
+            headers={"X-API-KEY": API_KEY}
+        )
+        return response.status_code
+
+
+class HttpTarget:
+    """Sends requests to a server over HTTP, with one kept-alive session per thread."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self._local = threading.local()
+
+    def request(self, method, path, json=None, data=None, content_type=None):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        headers = {"X-API-KEY": API_KEY}
+        if content_type:
+            headers["Content-Type"] = content_type
+        response = session.request(method, self.base_url + path, json=json, data=data, headers=headers)
+        response.content  # Include reading the whole body in the timing
+        return response.status_code
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(data_dir, workers, threads):
+    """Start Gunicorn with the add-on's configuration and wait until it answers."""
+    port = free_port()
+    env = dict(os.environ, PANTRY_DATA_DIR=data_dir, PANTRY_WORKERS=str(workers), PANTRY_THREADS=str(threads))
+    log = open(os.path.join(data_dir, "gunicorn.log"), "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}", "app:app"],
+        cwd=WEBAPP_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Gunicorn exited with status {process.returncode}. See {log.name}.")
+        try:
+            if requests.get(f"{base_url}/health", timeout=1).ok:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Gunicorn did not start within {SERVER_START_TIMEOUT}s. See {log.name}.")
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+# -----------------------------
+# Scenarios
+# -----------------------------
+class Recorder:
+    """Latencies and errors per operation, shared by every load generator thread."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.latencies = {}
+            self.errors = {}
+
+    def record(self, operation, seconds, ok):
+        with self._lock:
+            self.latencies.setdefault(operation, []).append(seconds)
+            if not ok:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+
+
+class Workload:
+    """One iteration of each scenario, issuing requests to a target and timing them."""
+
+    def __init__(self, target, recorder, products, category_size, lean):
+        self.target = target
+        self.recorder = recorder
+        self.products = products
+        self.category_size = category_size
+        self.suffix = "?response=lean" if lean else ""
+        # Names must not clash with rows left by another Workload of the same run, e.g. the
+        # client phase before the load phase, so each one gets its own random prefix
+        self._prefix = uuid.uuid4().hex[:8]
+        self._ids = itertools.count(1)
+
+    def timed(self, operation, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            ok = self.target.request(method, path, **kwargs) < 400
+        except requests.RequestException:
+            ok = False
+        self.recorder.record(operation, time.perf_counter() - started, ok)
+
+    def counts_poll(self, rng):
+        self.timed("counts_poll", "GET", "/counts")
+
+    def products_list(self, rng):
+        self.timed("products_list", "GET", "/products")
+
+    def products_page(self, rng):
+        self.timed("products_page", "GET", "/products?limit=100&sort=name")
+
+    def update_count(self, rng):
+        self.timed("update_count", "POST", "/update_count", json={
+            "product_name": product_name(rng.randint(1, self.products)),
+            "action": rng.choice(("increase", "decrease")),
+        })
+
+    def product_crud(self, rng):
+        name = f"Benchmark product {self._prefix}-{next(self._ids)}"
+        self.timed("product_add", "POST", f"/products{self.suffix}", json={
+            "name": name, "url": PRODUCT_URL, "category": "Category 0001",
+        })
+        self.timed("product_edit", "PUT", f"/products/{name}{self.suffix}", json={"category": "Category 0002"})
+        self.timed("product_delete", "DELETE", f"/products{self.suffix}", json={"name": name})
+
+    def category_delete(self, rng):
+        # Setup (untimed): a new category holding category_size products, imported in one request
+        category = f"Benchmark category {self._prefix}-{next(self._ids)}"
+        rows = "".join(
+            json.dumps({"name": f"{category} product {index}", "url": PRODUCT_URL, "category": category}) + "\n"
+            for index in range(self.category_size)
+        )
+        self.target.request(
+            "POST", "/products/import?format=ndjson&create_categories=true",
+            data=rows, content_type="application/x-ndjson"
+        )
+        # Deleting the category moves its products to "Uncategorized"
+        self.timed("category_delete", "DELETE", f"/categories{self.suffix}", json={"name": category})
+
+
+def run_client(workload, scenario, iterations, warmup, seed):
+    rng = random.Random(seed)
+    step = getattr(workload, scenario)
+    for _ in range(warmup):
+        step(rng)
+    workload.recorder.reset()  # Discard the warmup timings
+    started = time.perf_counter()
+    for _ in range(iterations):
+        step(rng)
+    return time.perf_counter() - started
+
+def run_load(workload, scenario, threads, duration, seed):
+    step = getattr(workload, scenario)
+    deadline = time.perf_counter() + duration
+
+    def worker(number):
+        rng = random.Random(seed + number)
+        while time.perf_counter() < deadline:
+            step(rng)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(number,), daemon=True) for number in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - started
+
+
+# -----------------------------
+# Results
+# -----------------------------
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0,
+        "mean_ms": round(sum(values) / len(values) * 1000, 3),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3),
+    }
+
+def print_results(mode, results):
+    print(f"\n{mode} mode")
+    print(f"{'operation':<18}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for operation, result in results.items():
+        print(
+            f"{operation:<18}{result['requests']:>10}{result['errors']:>8}{result['throughput_rps']:>10.1f}"
+            f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+        )
+
+def percent_change(current, previous):
+    if not previous:
+        return 0.0
+    return (current - previous) / previous * 100
+
+def compare(report, baseline, threshold):
+    """
+    Print the change of p95 latency and throughput against a baseline report.
+    Returns the operations that got slower or lost throughput by more than threshold percent.
+    """
+    if baseline.get("catalog") != report["catalog"]:
+        print(f"\nWarning: the baseline used a different catalog ({baseline.get('catalog')}).")
+    regressions = []
+    print(f"\nCompared with the baseline (regression threshold {threshold:g}%)")
+    print(f"{'operation':<26}{'p95 ms':>10}{'change':>9}{'req/s':>10}{'change':>9}")
+    for mode, results in report["results"].items():
+        for operation, result in results.items():
+            previous = baseline.get("results", {}).get(mode, {}).get(operation)
+            if previous is None:
+                continue
+            p95_change = percent_change(result["p95_ms"], previous["p95_ms"])
+            throughput_change = percent_change(result["throughput_rps"], previous["throughput_rps"])
+            regressed = p95_change > threshold or throughput_change < -threshold
+            if regressed:
+                regressions.append(f"{mode}/{operation}")
+            print(
+                f"{mode + '/' + operation:<26}{result['p95_ms']:>10.2f}{p95_change:>+8.1f}%"
+                f"{result['throughput_rps']:>10.1f}{throughput_change:>+8.1f}%{'  REGRESSION' if regressed else ''}"
+            )
+    return regressions
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# -----------------------------
+# Main
+# -----------------------------
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the Pantry Tracker HTTP API.")
+    parser.add_argument("--products", type=int, default=1000, help="Products in the synthetic catalog (default 1000)")
+    parser.add_argument("--categories", type=int, default=20, help="Categories in the synthetic catalog (default 20)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--mode", choices=("client", "load", "both"), default="both")
+    parser.add_argument("--iterations", type=int, default=200, help="Iterations per scenario in client mode (default 200)")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed iterations before each client scenario (default 5)")
+    parser.add_argument("--threads", type=int, default=8, help="Load generator threads (default 8)")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per scenario in load mode (default 10)")
+    parser.add_argument("--workers", type=int, default=2, help="Gunicorn workers in load mode (default 2)")
+    parser.add_argument("--server-threads", type=int, default=16, help="Threads per Gunicorn worker (default 16)")
+    parser.add_argument("--category-size", type=int, default=20, help="Products moved by each category delete (default 20)")
+    parser.add_argument("--lean", action="store_true", help="Ask mutations for lean responses (?response=lean)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the catalog and the request mix")
+    parser.add_argument("--output", default="benchmark_results.json", help="Result file (default benchmark_results.json)")
+    parser.add_argument("--baseline", help="Earlier result file to compare with")
+    parser.add_argument("--threshold", type=float, default=10, help="Percent change counted as a regression (default 10)")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary data directory")
+    args = parser.parse_args()
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if not 1 <= args.categories <= args.products:
+        parser.error("--categories must be between 1 and --products")
+    return args
+
+def main():
+    args = parse_args()
+    data_dir = tempfile.mkdtemp(prefix="pantry_benchmark_")
+    os.environ["PANTRY_DATA_DIR"] = data_dir
+    report = {
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "catalog": {"products": args.products, "categories": args.categories, "seed": args.seed},
+        "settings": {
+            "iterations": args.iterations, "threads": args.threads, "duration": args.duration,
+            "workers": args.workers, "server_threads": args.server_threads, "lean": args.lean,
+        },
+        "results": {},
+    }
+
+    try:
+        write_config(data_dir)
+        started = time.perf_counter()
+        seed_catalog(os.path.join(data_dir, "pantry_data.db"), args.products, args.categories, args.seed)
+        print(f"Seeded {args.products} products in {args.categories} categories in {time.perf_counter() - started:.1f}s ({data_dir})")
+
+        if args.mode in ("client", "both"):
+            recorder = Recorder()
+            workload = Workload(ClientTarget(), recorder, args.products, args.category_size, args.lean)
+            results = {}
+            for scenario in args.scenarios:
+                elapsed = run_client(workload, scenario, args.iterations, args.warmup, args.seed)
+                for operation, latencies in recorder.latencies.items():
+                    results[operation] = summarize(latencies, recorder.errors.get(operation, 0), elapsed)
+            report["results"]["client"] = results
+            print_results("client", results)
+
+        if args.mode in ("load", "both"):
+            process, base_url = start_server(data_dir, args.workers, args.server_threads)
+            try:
+                target = HttpTarget(base_url)
+                results = {}
+                for scenario in args.scenarios:
+                    recorder = Recorder()
+                    workload = Workload(target, recorder, args.products, args.category_size, args.lean)
+                    elapsed = run_load(workload, scenario, args.threads, args.duration, args.seed)
+                    for operation, latencies in recorder.latencies.items():
+                        results[operation] = summarize(latencies, recorder.errors.get(operation, 0), elapsed)
+                report["results"]["load"] = results
+                print_results("load", results)
+            finally:
+                stop_server(process)
+    finally:
+        if args.keep:
+            print(f"\nData directory kept at {data_dir}")
+        else:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressions: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,7 @@
 #set -x
 
 
-# Start the Flask app with SSL using exec to replace the shell with the Flask process
+# Start the app under Gunicorn using exec to replace the shell with the server process
+# (workers, threads and timeouts are read from the add-on options, see gunicorn.conf.py)
 echo "Starting Pantry Tracker"
-exec python /opt/webapp/app.py
+exec gunicorn --config /opt/webapp/gunicorn.conf.py --chdir /opt/webapp app:app
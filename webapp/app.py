@@ -1,22 +1,57 @@
 # pantry_tracker/webapp/app.py
 
-from flask import Flask, request, jsonify, render_template, send_file, redirect, url_for
+import time
+STARTUP_STARTED = time.perf_counter()  # Cold boot is timed from here, see log_startup_report()
+
+from flask import Flask, Response, request, jsonify, render_template, send_file, redirect, url_for, stream_with_context, g, has_request_context
 import os
 import logging
-import configparser
-from sqlalchemy import create_engine
+from sqlalchemy import func, or_, and_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker, scoped_session
-from models import Base, Category, Product, Count
-from schemas import CategorySchema, UpdateCategorySchema, ProductSchema, UpdateProductSchema
+from models import Category, Product, Count, ChangeLog
+from schemas import CategorySchema, UpdateCategorySchema, ProductSchema, UpdateProductSchema, ImportProductSchema, CountOperationSchema
 from marshmallow import ValidationError
-import requests  # For interacting with OpenFoodFacts
-from migrate import migrate_database
+from openfoodfacts import DEFAULT_BASE_URL, OpenFoodFactsClient, ProductLookupCache, LookupFailed
+from enrichment import EnrichmentJob
+from thumbnails import ThumbnailCache, ImageUnavailable
+from migrate import migrate_database, check_database_file, InvalidDatabase, SCHEMA_VERSION
+from events import EventBroker, SubscriberLimitReached
+from cache import ResponseCache
+from versioning import SharedCounters
+from database import load_sqlite_pragmas, create_db_engine, read_sqlite_pragmas, restore_database, match_page_size, read_page_size, PageSizeMismatch, DatabaseGate, DatabaseBusy
+from backups import BackupManager, snapshot_database
+from metrics import RequestMetrics, instrument_engine, format_metric
+from settings import SettingsStore
+from auth import ApiKeyAuth, InvalidApiKey, RateLimitExceeded
 from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.formparser import parse_form_data
 from functools import wraps
 import secrets 
-from filelock import FileLock, Timeout
-import shutil
 import datetime
+import threading
+import csv
+import io
+import json
+import base64
+
+# Seconds spent in each startup phase, in order, logged by log_startup_report()
+startup_phases = []
+_startup_phase_started = STARTUP_STARTED
+
+def mark_startup_phase(name):
+    """Record the time since the previous phase ended as the duration of phase name."""
+    global _startup_phase_started
+    now = time.perf_counter()
+    startup_phases.append((name, now - _startup_phase_started))
+    _startup_phase_started = now
+
+def log_startup_report():
+    phases = ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in startup_phases)
+    total = (time.perf_counter() - STARTUP_STARTED) * 1000
+    logger.info(f"Startup finished in {total:.0f}ms ({phases}).")
+
+mark_startup_phase("imports")
 
 app = Flask(__name__)
 
@@ -27,8 +62,13 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_port=1, x_
 logging.basicConfig(level=logging.DEBUG)  # Set to DEBUG for detailed logs
 logger = logging.getLogger(__name__)
 
-CONFIG_FILE = "/config/pantry_data/config.ini"
-config = configparser.ConfigParser()
+# Everything the add-on stores lives here. PANTRY_DATA_DIR points it elsewhere, e.g. for tests and benchmarks
+DATA_DIR = os.environ.get("PANTRY_DATA_DIR", "/config/pantry_data")
+
+CONFIG_FILE = os.path.join(DATA_DIR, "config.ini")
+
+# Cached settings shared by all workers. Request handlers use settings.read() and settings.update()
+settings = SettingsStore(CONFIG_FILE)
 
 # Function to generate a secure API key
 def generate_api_key(length=32):
@@ -36,137 +76,558 @@ def generate_api_key(length=32):
     logger.debug("Generated new API key.")
     return api_key
 
+def add_missing_settings(parser):
+    """Add the 'Settings' section, default theme and an API key where they are missing."""
+    if 'Settings' not in parser:
+        logger.debug("'Settings' section missing. Adding with default theme and API key.")
+        parser['Settings'] = {}
+
+    # Ensure 'theme' key exists
+    if 'theme' not in parser['Settings']:
+        logger.debug("'theme' key missing. Setting default to 'light'.")
+        parser['Settings']['theme'] = 'light'
+
+    # Check if 'api_key' exists and is non-empty
+    if not parser['Settings'].get('api_key', '').strip():
+        logger.debug("'api_key' missing or empty. Generating a new API key.")
+        parser['Settings']['api_key'] = generate_api_key()
+        logger.info("Generated a new API key and added it to config.ini.")
+    else:
+        logger.debug("'api_key' already exists and is valid.")
+
 # Initialize config
 def initialize_config():
     try:
-        logger.debug(f"Checking existence of config file at: {CONFIG_FILE}")
-        if not os.path.exists(CONFIG_FILE):
-            logger.debug("Config file does not exist. Creating a new one with default settings and API key.")
-            config['Settings'] = {
-                'theme': 'light',
-                'api_key': generate_api_key()
-            }
-            os.makedirs(os.path.dirname(CONFIG_FILE), exist_ok=True)  # Ensure directory exists
-            with open(CONFIG_FILE, 'w') as f:
-                config.write(f)
-            logger.info("Created config.ini with a new API key.")
-        else:
-            # Read the existing config file
-            config.read(CONFIG_FILE)
-            logger.debug("Config file found. Reading existing settings.")
-
-            # Ensure 'Settings' section exists
-            if 'Settings' not in config:
-                logger.debug("'Settings' section missing. Adding with default theme and API key.")
-                config['Settings'] = {
-                    'theme': 'light',
-                    'api_key': generate_api_key()
-                }
-                with open(CONFIG_FILE, 'w') as f:
-                    config.write(f)
-                logger.info("Added 'Settings' section with a new API key.")
-            else:
-                # Ensure 'theme' key exists
-                if 'theme' not in config['Settings']:
-                    logger.debug("'theme' key missing. Setting default to 'light'.")
-                    config['Settings']['theme'] = 'light'
-
-                # Check if 'api_key' exists and is non-empty
-                api_key_exists = config.has_option('Settings', 'api_key')
-                api_key_value = config.get('Settings', 'api_key') if api_key_exists else ''
-
-                if not api_key_exists or not api_key_value.strip():
-                    logger.debug("'api_key' missing or empty. Generating a new API key.")
-                    config['Settings']['api_key'] = generate_api_key()
-                    logger.info("Generated a new API key and added it to config.ini.")
-                else:
-                    logger.debug("'api_key' already exists and is valid.")
-
-                # Write any missing defaults or new API key back to file
-                with open(CONFIG_FILE, 'w') as f:
-                    config.write(f)
-                logger.debug("Written updated settings to config.ini.")
+        logger.debug(f"Checking config file at: {CONFIG_FILE}")
+        # Only writes the file if something was missing, so a normal start does no writes to /config
+        if settings.update(add_missing_settings):
+            logger.info("Written default settings to config.ini.")
     except Exception as e:
         logger.exception(f"Failed to initialize configuration: {e}")
         raise  # Re-raise exception after logging
 
 initialize_config()
+# Tunables below are read once at startup from this snapshot; changes to them need a restart
+config = settings.read()
+mark_startup_phase("config")
 
 # Define the path to the database within the container
-DB_FILE = "/config/pantry_data/pantry_data.db"
+DB_FILE = os.path.join(DATA_DIR, "pantry_data.db")
 
 # Ensure the pantry_data directory exists
 DB_DIR = os.path.dirname(DB_FILE)
 os.makedirs(DB_DIR, exist_ok=True)
 
-# If needed, ensure the database schema is valid
-# migrate_database(DB_FILE)  # (commented if no migrations needed)
+# SQLite tuning profile applied to every new connection (see database.py)
+SQLITE_PRAGMAS = load_sqlite_pragmas(config)
 
 # Initialize the database
 try:
+    # Apply any pending schema migrations (a no-op when the schema is current)
+    migrate_database(DB_FILE)
     logger.debug(f"Initializing database at: sqlite:///{DB_FILE}")
-    engine = create_engine(f'sqlite:///{DB_FILE}', connect_args={'check_same_thread': False}, echo=False)
-    Base.metadata.create_all(engine)
+    engine = create_db_engine(DB_FILE, SQLITE_PRAGMAS)
     logger.info("Database initialized successfully.")
 except Exception as e:
     logger.exception(f"Failed to initialize the database: {e}")
     raise
+mark_startup_phase("database")
 
 # Create a configured "Session" class
 SessionFactory = sessionmaker(bind=engine)
 # Create a scoped session
 Session = scoped_session(SessionFactory)
 
+# Requests hold the gate while they use the database, so upload_db and delete_database can
+# replace its contents safely under load (see DatabaseGate in database.py)
+DATABASE_SWAP_WAIT = 10  # Seconds a request waits for a database swap before answering 503
+DATABASE_DRAIN_TIMEOUT = 10  # Seconds a swap waits for in-flight requests before giving up
+DATABASE_UNGATED_ENDPOINTS = {"static", "health", "events", "poll_events"}  # Long-lived or no database access
+
+database_gate = DatabaseGate(os.path.join(DB_DIR, "database.lock"))
+_engine_generation = database_gate.generation
+_engine_generation_lock = threading.Lock()
+
+def refresh_engine_pool():
+    """Drop this process's pooled connections if the database was swapped since they were opened."""
+    global _engine_generation
+    generation = database_gate.generation
+    if generation == _engine_generation:
+        return
+    with _engine_generation_lock:
+        if generation != _engine_generation:
+            engine.dispose()
+            _engine_generation = generation
+            logger.info(f"Database generation changed to {generation}. Connection pool rebuilt.")
+
 def sanitize_entity_id(name: str) -> str:
     """Sanitize the product name to create a unique entity ID without category."""
     return f"sensor.product_{name.lower().replace(' ', '_').replace('-', '_')}"
 
+# -----------------------------
+# Data Version (Conditional GET)
+# -----------------------------
+# Monotonically increasing counter bumped by every write route. Read routes use it
+# as an ETag so polling clients get a 304 without touching the database.
+# The epoch makes sure ETags issued before a restart are never reused.
+# Both live in memory shared with every Gunicorn worker (see versioning.py), so
+# they must be created before the workers are forked (preload_app).
+DATA_VERSION_EPOCH = secrets.token_hex(4)
+
+# Cache groups each have their own version, bumped together with the data version
+CACHE_GROUPS = ("categories", "products", "counts", "product_lookup")
+shared_versions = SharedCounters(("data",) + CACHE_GROUPS)
+
+def get_data_version() -> int:
+    """Return the current data version."""
+    return shared_versions.get("data")
+
+def bump_data_version(*groups) -> int:
+    """
+    Increment the data version after a successful write and return the new value.
+    The versions of the given cache groups are bumped in the same step, which
+    invalidates their cached payloads in every worker process.
+    """
+    version = shared_versions.increment("data", *groups)[0]
+    logger.debug(f"Data version bumped to {version} (cache groups: {', '.join(groups) or 'none'})")
+    return version
+
+def make_etag(version: int) -> str:
+    """Build the ETag value for a given data version."""
+    return f"{DATA_VERSION_EPOCH}-{version}"
+
+def conditional_get(view):
+    """
+    Answer GET requests with 304 Not Modified when the client's If-None-Match
+    matches the current data version, otherwise attach the ETag to the response.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != "GET":
+            return view(*args, **kwargs)
+
+        # Capture the version before querying so a concurrent write yields a stale ETag, never a stale body
+        etag = make_etag(get_data_version())
+        if request.if_none_match.contains(etag):
+            logger.debug(f"ETag {etag} matched for {request.path}. Returning 304.")
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
+        response = app.make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            response.set_etag(etag)
+        return response
+    return wrapper
+
+# -----------------------------
+# Response Cache
+# -----------------------------
+# Serialized GET payloads are kept in memory per worker process. Each entry is tagged
+# with the version of its cache group and is ignored once notify_committed() has bumped
+# that version, so a write in any worker invalidates the affected groups everywhere.
+response_cache = ResponseCache(
+    max_entries=config.getint('Cache', 'max_entries', fallback=256),
+    enabled=config.getboolean('Cache', 'enabled', fallback=True)
+)
+
+# Cache groups invalidated by each type of change (products embed category names and counts)
+CACHE_GROUPS_BY_CHANGE = {
+    "count": ("counts", "products"),
+    "product": ("counts", "products", "product_lookup"),
+    "category": ("categories", "products", "product_lookup"),
+}
+
+def cache_key() -> str:
+    """Build a cache key from the request path and query string, ignoring the API key."""
+    args = sorted((key, value) for key, value in request.args.items(multi=True) if key != "api_key")
+    return request.path + "?" + "&".join(f"{key}={value}" for key, value in args)
+
+def cached_get(group):
+    """Serve GET responses from the response cache, filling it on a miss."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET" or not response_cache.enabled:
+                return view(*args, **kwargs)
+
+            key = cache_key()
+            # Capture the group version before querying so a concurrent write leaves the entry stale
+            version = (database_gate.generation, shared_versions.get(group))
+            cached = response_cache.get(key, version)
+            if cached is not None:
+                body, mimetype = cached
+                return app.response_class(body, mimetype=mimetype)
+
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                response_cache.set(key, (response.get_data(), response.mimetype), version)
+            return response
+        return wrapper
+    return decorator
+
+def lookup_product(session, name=None, barcode=None):
+    """
+    Resolve a product by name or barcode to an (id, name) tuple, or None if it does not exist.
+    Both lookups use a unique index, and the result is cached until the product changes.
+    """
+    key = f"product:name:{name}" if name else f"product:barcode:{barcode}"
+    # Keyed on the gate generation too, so ids cached before a database swap are never served after it
+    version = (database_gate.generation, shared_versions.get("product_lookup"))
+    product = response_cache.get(key, version)
+    if product is not None:
+        return product
+
+    condition = Product.name == name if name else Product.barcode == barcode
+    row = session.query(Product.id, Product.name).filter(condition).first()
+    if row is not None:
+        product = (row.id, row.name)
+        response_cache.set(key, product, version)
+    return product
+
+def cache_groups_for(changes):
+    """Return the cache groups affected by a set of committed changes."""
+    groups = set()
+    for change in changes:
+        if change.entity_type == "database":
+            return CACHE_GROUPS
+        groups.update(CACHE_GROUPS_BY_CHANGE.get(change.entity_type, ()))
+    return tuple(sorted(groups))
+
+# -----------------------------
+# Response Modes
+# -----------------------------
+# "full" echoes the whole catalog after a mutation, "lean" returns only the affected entity.
+# Clients opt in per request with ?response=lean or a "Prefer: return=minimal" header.
+DEFAULT_RESPONSE_MODE = "full"
+
+def wants_lean_response() -> bool:
+    """Return True if the current mutation should answer with the affected entity only."""
+    mode = request.args.get("response")
+    if mode:
+        return mode.lower() == "lean"
+    if "return=minimal" in request.headers.get("Prefer", ""):
+        return True
+    return DEFAULT_RESPONSE_MODE == "lean"
+
+def serialize_product(product):
+    """Convert a product into its JSON representation."""
+    return {
+        "name": product.name,
+        "url": product.url,
+        "category": product.category.name,
+        "barcode": product.barcode,
+        "count": product.count.count if product.count else 0
+    }
+
+def product_listing_query(session):
+    """Build the single joined query used to list products with their category and count."""
+    return (
+        session.query(Product.id, Product.name, Product.url, Category.name, Product.barcode, func.coalesce(Count.count, 0))
+        .join(Category, Product.category_id == Category.id)
+        .outerjoin(Count, Count.product_id == Product.id)
+    )
+
+def serialize_product_row(row):
+    """Convert a row from product_listing_query into its JSON representation."""
+    _, name, url, category, barcode, count = row
+    return {"name": name, "url": url, "category": category, "barcode": barcode, "count": count}
+
+def list_products(session):
+    """Return every product with its category name and count using a single joined query."""
+    return [serialize_product_row(row) for row in product_listing_query(session).order_by(Product.id)]
+
+DEFAULT_CATEGORY_NAME = "Uncategorized"  # Products of a deleted category are moved here
+
+def ensure_category(session, name):
+    """Return the id of the named category, creating it first if needed. Safe when requests race to create it."""
+    session.execute(sqlite_insert(Category.__table__).values(name=name).on_conflict_do_nothing(index_elements=["name"]))
+    return session.query(Category.id).filter_by(name=name).scalar()
+
+def move_category_products(session, source_id, target_id):
+    """Move every product of one category to another with a single UPDATE. Returns the number moved."""
+    return (
+        session.query(Product)
+        .filter(Product.category_id == source_id)
+        .update({Product.category_id: target_id}, synchronize_session=False)
+    )
+
+def delete_category_row(session, category_id):
+    """
+    Delete a category that no longer has products with a plain DELETE.
+    session.delete() would load Category.products first to apply its delete-orphan cascade.
+    """
+    session.query(Category).filter(Category.id == category_id).delete(synchronize_session=False)
+
+def list_category_names(session):
+    """Return every category name without loading full Category objects."""
+    return [name for (name,) in session.query(Category.name).order_by(Category.id)]
+
+# -----------------------------
+# Change Log (Delta Feed)
+# -----------------------------
+CHANGE_LOG_RETENTION = 1000  # Number of most recent change log entries kept for delta sync
+CHANGE_LOG_COMPACT_EVERY = 100  # Compact the change log once every N entries
+CHANGES_PAGE_LIMIT = 500  # Maximum number of changes returned per request
+
+# Push channel for committed changes (Server-Sent Events with a long-poll fallback)
+EVENT_MAX_SUBSCRIBERS = 10  # Concurrent SSE streams and long-poll waiters
+EVENT_QUEUE_SIZE = 100  # Pending events per subscriber before it is asked to resync
+EVENT_HEARTBEAT_INTERVAL = 15  # Seconds between keep-alive comments on idle streams
+LONG_POLL_TIMEOUT = 30  # Maximum seconds a long-poll request is held open
+
+event_broker = EventBroker(max_subscribers=EVENT_MAX_SUBSCRIBERS, queue_size=EVENT_QUEUE_SIZE)
+
+def record_change(session, entity_type, action, name=None, old_name=None, count=None):
+    """
+    Add a change log entry to the session so it is committed in the same
+    transaction as the change it describes. Old entries are compacted periodically.
+    """
+    entry = ChangeLog(entity_type=entity_type, action=action, name=name, old_name=old_name, count=count)
+    session.add(entry)
+    session.flush()
+
+    if entry.id % CHANGE_LOG_COMPACT_EVERY == 0:
+        compact_change_log(session, entry.id)
+    return entry
+
+def compact_change_log(session, latest_id):
+    """Delete change log entries older than the retention window."""
+    removed = session.query(ChangeLog).filter(
+        ChangeLog.id <= latest_id - CHANGE_LOG_RETENTION
+    ).delete(synchronize_session=False)
+    logger.debug(f"Compacted {removed} change log entries.")
+
+def invalidate_swapped_data():
+    """
+    Bump the data version and every cache group after the database contents were replaced.
+    Called while the gate is still held exclusively, so no request can be served a cached
+    body, a 304 or a product id from before the swap once the gate reopens.
+    """
+    return bump_data_version(*CACHE_GROUPS)
+
+def record_database_reset():
+    """Record that the database was replaced so delta and push clients know to resync."""
+    session = Session()
+    try:
+        change = record_change(session, "database", "reset")
+        session.commit()
+        notify_committed(change)
+    finally:
+        Session.remove()
+
+def notify_committed(*changes):
+    """
+    Bump the data version and the versions of the cache groups the committed changes affect.
+    The change watcher of every worker process picks the new version up and pushes
+    the change log entries to its event subscribers.
+    """
+    return bump_data_version(*cache_groups_for(changes))
+
+# Change watcher: one background thread per worker process, started with the first
+# event subscriber. Writes can happen in any worker, so events are published from
+# the committed change log instead of from the request that made the change.
+CHANGE_WATCH_INTERVAL = 0.2  # Seconds between checks of the shared data version
+
+_change_watcher = None
+_change_watcher_lock = threading.Lock()
+
+def ensure_change_watcher():
+    """Start this process's change watcher if it is not running yet."""
+    global _change_watcher
+    with _change_watcher_lock:
+        if _change_watcher is not None and _change_watcher.is_alive():
+            return
+        # Read the starting point here so nothing committed after a subscriber connects is missed
+        version = get_data_version()
+        session = Session()
+        try:
+            last_id = session.query(func.max(ChangeLog.id)).scalar() or 0
+        finally:
+            Session.remove()
+        _change_watcher = threading.Thread(
+            target=watch_changes, args=(version, database_gate.generation, last_id),
+            name="change-watcher", daemon=True
+        )
+        _change_watcher.start()
+        logger.debug(f"Change watcher started at version {version}, change {last_id}.")
+
+def watch_changes(version, generation, last_id):
+    """Publish new change log entries whenever the shared data version moves."""
+    while True:
+        time.sleep(CHANGE_WATCH_INTERVAL)
+        current = get_data_version()
+        if current == version:
+            continue
+        version = current
+        # The change log of a replaced database is unrelated to the one already published
+        replaced = database_gate.generation != generation
+        generation = database_gate.generation
+        try:
+            last_id = publish_changes_since(last_id, make_etag(version), replaced)
+        except Exception as e:
+            logger.error(f"Change watcher failed to publish changes: {e}")
+        # Wake long-poll waiters even if no change log entry was published
+        event_broker.notify()
+
+def publish_changes_since(last_id, etag, replaced=False):
+    """
+    Publish the change log entries committed after last_id and return the new last id.
+    A single resync event is published instead when there are more entries than a
+    subscriber queue holds, or when the database was replaced.
+    """
+    session = Session()
+    try:
+        latest_id = session.query(func.max(ChangeLog.id)).scalar() or 0
+        if replaced or latest_id < last_id:
+            event_broker.publish("resync", {"reason": "database", "version": etag})
+            return latest_id
+
+        entries = session.query(ChangeLog).filter(
+            ChangeLog.id > last_id
+        ).order_by(ChangeLog.id).limit(event_broker.queue_size + 1).all()
+        if len(entries) > event_broker.queue_size:
+            event_broker.publish("resync", {"reason": "backlog", "version": etag})
+            return max(latest_id, entries[-1].id)
+
+        for entry in entries:
+            event_broker.publish("change", {**serialize_change(entry), "version": etag}, event_id=entry.id)
+        return entries[-1].id if entries else last_id
+    finally:
+        Session.remove()
+
+def serialize_change(entry):
+    """Convert a change log entry into its JSON representation."""
+    change = {
+        "id": entry.id,
+        "type": entry.entity_type,
+        "action": entry.action,
+        "name": entry.name,
+        "timestamp": entry.created_at.isoformat(),
+    }
+    if entry.entity_type in ("count", "product") and entry.name:
+        change["entity_id"] = sanitize_entity_id(entry.name)
+        if entry.old_name:
+            change["old_entity_id"] = sanitize_entity_id(entry.old_name)
+    if entry.old_name:
+        change["old_name"] = entry.old_name
+    if entry.count is not None:
+        change["count"] = entry.count
+    return change
+
+# -----------------------------
+# Request Metrics
+# -----------------------------
+# Request timings and SQL query counts are collected in shared memory (see metrics.py) and
+# exposed in the Prometheus format on /metrics.
+SLOW_REQUEST_SECONDS = config.getfloat('Metrics', 'slow_request_seconds', fallback=1.0)
+UNTIMED_ENDPOINTS = {"events", "poll_events"}  # Held open on purpose, so never logged as slow
+
+request_metrics = None  # Created at the end of this module, once every endpoint is registered
+
+def record_query(duration):
+    """Attribute a finished SQL statement to the current request, or to background work."""
+    if has_request_context():
+        g.db_queries = g.get("db_queries", 0) + 1
+        g.db_query_seconds = g.get("db_query_seconds", 0.0) + duration
+    elif request_metrics is not None:
+        request_metrics.observe_queries("background", 1, duration)
+
+instrument_engine(engine, record_query)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get("request_started")
+    if started is None or request_metrics is None:
+        return response
+    duration = time.perf_counter() - started
+    endpoint = request.endpoint or "unmatched"
+    queries = g.get("db_queries", 0)
+    query_seconds = g.get("db_query_seconds", 0.0)
+    request_metrics.observe_request(endpoint, response.status_code, duration, queries, query_seconds)
+
+    if duration >= SLOW_REQUEST_SECONDS and endpoint not in UNTIMED_ENDPOINTS:
+        logger.warning(
+            "Slow request: method=%s path=%s endpoint=%s key=%s status=%d duration_ms=%.1f queries=%d query_ms=%.1f",
+            request.method, request.path, endpoint, g.get("api_key_name", "-"), response.status_code,
+            duration * 1000, queries, query_seconds * 1000
+        )
+    else:
+        logger.debug(
+            "Request: method=%s path=%s endpoint=%s key=%s status=%d duration_ms=%.1f queries=%d query_ms=%.1f",
+            request.method, request.path, endpoint, g.get("api_key_name", "-"), response.status_code,
+            duration * 1000, queries, query_seconds * 1000
+        )
+    return response
+
 # -----------------------------
 # Global API Key Authentication
 # -----------------------------
 
+# Endpoints served without an API key: the health check and the UI's static assets
+AUTH_EXEMPT_ENDPOINTS = {"health", "static"}
+
+# Keys are checked in constant time; rate limits are shared by all workers (see auth.py)
+api_key_auth = ApiKeyAuth(settings)
+
 @app.before_request
 def before_request_func():
     """
     Enforce API key authentication for external requests.
     Skip authentication for requests coming through Home Assistant's Ingress and exempted routes.
     """
-    try:
-        # Exempted routes that do not require API key
-        exempt_paths = ['/health']
-
-        # If the request path is exempted, skip authentication
-        if request.path in exempt_paths:
-            logger.debug(f"Exempt path accessed: {request.path}. Skipping API key authentication.")
-            return  # Proceed to the requested route
-
-        # Detect if the request is coming via Ingress by checking for 'X-Ingress-Path' header
-        if 'X-Ingress-Path' in request.headers:
-            logger.debug("Request via Ingress detected. Skipping API key authentication.")
-            return  # Proceed to the requested route
-
-        # Retrieve the API key from config
-        api_key = config['Settings'].get('api_key')
-        if not api_key:
-            logger.error("API key not found in config.ini.")
-            return jsonify({"status": "error", "message": "Server configuration error."}), 500
+    if request.endpoint in AUTH_EXEMPT_ENDPOINTS or 'X-Ingress-Path' in request.headers:
+        return  # Proceed to the requested route
 
+    try:
         # Retrieve the API key from request headers or query parameters
         request_api_key = request.headers.get('X-API-KEY') or request.args.get('api_key')
-
         if not request_api_key:
             logger.warning("API key missing in request.")
             return jsonify({"status": "error", "message": "API key is missing."}), 401
 
-        if request_api_key != api_key:
-            logger.warning("Invalid API key attempt: %s", request_api_key)
-            return jsonify({"status": "error", "message": "Invalid API key."}), 403
-
-        logger.debug("API key authentication successful for request.")
+        g.api_key_name = api_key_auth.authenticate(request_api_key)
+    except InvalidApiKey:
+        if not api_key_auth.keys():
+            logger.error("API key not found in config.ini.")
+            return jsonify({"status": "error", "message": "Server configuration error."}), 500
+        # The presented key is never logged, it may be a valid key with a typo
+        logger.warning("Invalid API key attempt from %s for %s.", request.remote_addr, request.path)
+        return jsonify({"status": "error", "message": "Invalid API key."}), 403
+    except RateLimitExceeded as e:
+        logger.warning("Rate limit exceeded: key=%s path=%s retry_after=%d", e.name, request.path, e.retry_after)
+        response = jsonify({"status": "error", "message": "Rate limit exceeded. Try again later."})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 429
     except Exception as e:
         logger.exception(f"Error during API key authentication: {e}")
         return jsonify({"status": "error", "message": "Authentication failed."}), 500
 
+# -----------------------------
+# Database Gate
+# -----------------------------
+@app.before_request
+def enter_database_gate():
+    """Hold the database gate for the duration of the request, waiting out a database swap."""
+    if request.endpoint in DATABASE_UNGATED_ENDPOINTS:
+        return
+    try:
+        database_gate.acquire_shared(DATABASE_SWAP_WAIT)
+    except DatabaseBusy:
+        logger.warning(f"Request to {request.path} rejected while the database is being replaced.")
+        response = jsonify({"status": "error", "message": "The database is being replaced. Try again shortly."})
+        response.headers["Retry-After"] = "5"
+        return response, 503
+    refresh_engine_pool()
+
+@app.teardown_request
+def leave_database_gate(exc):
+    database_gate.release_shared()
+
 # -----------------------------
 # Routes
 # -----------------------------
@@ -174,14 +635,14 @@ def before_request_func():
 @app.route("/")
 def index():
     """Root endpoint to render the HTML UI with the current API key."""
-    api_key = config['Settings'].get('api_key', '')
+    api_key = settings.get('Settings', 'api_key', fallback='')
     logger.debug("Rendering index.html with API key")
     return render_template("index.html", api_key=api_key)
 
 @app.route("/index.html")
 def index_html():
     """Route to render index.html with the current API key."""
-    api_key = config['Settings'].get('api_key', '')
+    api_key = settings.get('Settings', 'api_key', fallback='')
     logger.debug("Rendering index.html via /index.html with API key")
     return render_template("index.html", api_key=api_key)
 
@@ -189,12 +650,13 @@ def index_html():
 # Categories
 # -----------------------------
 @app.route("/categories", methods=["GET", "POST", "DELETE"])
+@conditional_get
+@cached_get("categories")
 def categories_route():
     session = Session()
     if request.method == "GET":
         try:
-            categories = session.query(Category).all()
-            category_names = [cat.name for cat in categories]
+            category_names = list_category_names(session)
             logger.info("Fetched categories: %s", category_names)
             return jsonify(category_names)
         except Exception as e:
@@ -219,11 +681,14 @@ def categories_route():
 
             new_category = Category(name=cat_name)
             session.add(new_category)
+            change = record_change(session, "category", "create", name=cat_name)
             session.commit()
+            version = notify_committed(change)
             logger.info(f"Added new category: {cat_name}")
 
-            category_names = [cat.name for cat in session.query(Category).all()]
-            return jsonify({"status": "ok", "categories": category_names})
+            if wants_lean_response():
+                return jsonify({"status": "ok", "category": cat_name, "version": make_etag(version)})
+            return jsonify({"status": "ok", "categories": list_category_names(session), "version": make_etag(version)})
         except Exception as e:
             session.rollback()
             logger.error(f"Error adding category '{cat_name}': {e}")
@@ -239,37 +704,29 @@ def categories_route():
             return jsonify({"status": "error", "message": "Category name is required for deletion"}), 400
 
         try:
-            category = session.query(Category).filter_by(name=category_name).first()
-            if not category:
+            category_id = session.query(Category.id).filter_by(name=category_name).scalar()
+            if category_id is None:
                 logger.warning("Attempted to delete non-existent category: %s", category_name)
                 return jsonify({"status": "error", "message": "Category not found"}), 404
 
-            # Define the default category name
-            default_category_name = "Uncategorized"
-            default_category = session.query(Category).filter_by(name=default_category_name).first()
-
-            # If default category doesn't exist, create it
-            if not default_category:
-                default_category = Category(name=default_category_name)
-                session.add(default_category)
-                session.commit()
-                logger.info(f"Created default category: {default_category_name}")
-
-            # Reassign all products under the target category to the default category
-            associated_products = session.query(Product).filter_by(category_id=category.id).all()
-            for product in associated_products:
-                product.category = default_category
-                logger.info(f"Reassigned product '{product.name}' to category '{default_category_name}'")
-
-            session.commit()
+            default_category_id = ensure_category(session, DEFAULT_CATEGORY_NAME)
+            if category_id == default_category_id:
+                if session.query(Product.id).filter_by(category_id=category_id).first():
+                    logger.warning("Attempted to delete the default category while it has products")
+                    return jsonify({"status": "error", "message": f"'{DEFAULT_CATEGORY_NAME}' cannot be deleted while it has products"}), 400
+                moved = 0
+            else:
+                moved = move_category_products(session, category_id, default_category_id)
 
-            # Proceed to delete the original category
-            session.delete(category)
+            delete_category_row(session, category_id)
+            change = record_change(session, "category", "delete", name=category_name)
             session.commit()
-            logger.info(f"Deleted category: {category_name}")
+            version = notify_committed(change)
+            logger.info(f"Deleted category '{category_name}' and moved {moved} products to '{DEFAULT_CATEGORY_NAME}'")
 
-            category_names = [cat.name for cat in session.query(Category).all()]
-            return jsonify({"status": "ok", "categories": category_names})
+            if wants_lean_response():
+                return jsonify({"status": "ok", "deleted": category_name, "moved": moved, "version": make_etag(version)})
+            return jsonify({"status": "ok", "categories": list_category_names(session), "moved": moved, "version": make_etag(version)})
         except Exception as e:
             session.rollback()
             logger.error(f"Error deleting category '{category_name}': {e}")
@@ -277,6 +734,51 @@ def categories_route():
         finally:
             Session.remove()
 
+# -----------------------------
+# Merge Category
+# -----------------------------
+@app.route("/categories/<name>/merge", methods=["POST"])
+def merge_category(name):
+    """
+    Move every product of a category into another one and delete it, in one transaction.
+    Payload: {"into": "Target Category Name"}
+    """
+    data = request.get_json(silent=True) or {}
+    target_name = (data.get("into") or "").strip()
+    if not target_name:
+        logger.warning("Target category missing in merge request")
+        return jsonify({"status": "error", "message": "Target category ('into') is required"}), 400
+    if target_name == name:
+        logger.warning("Attempted to merge category '%s' into itself", name)
+        return jsonify({"status": "error", "message": "A category cannot be merged into itself"}), 400
+
+    session = Session()
+    try:
+        category_ids = dict(session.query(Category.name, Category.id).filter(Category.name.in_([name, target_name])))
+        if name not in category_ids:
+            logger.warning("Category '%s' not found for merging", name)
+            return jsonify({"status": "error", "message": "Category not found"}), 404
+        if target_name not in category_ids:
+            logger.warning("Target category '%s' not found for merging", target_name)
+            return jsonify({"status": "error", "message": "Target category not found"}), 404
+
+        moved = move_category_products(session, category_ids[name], category_ids[target_name])
+        delete_category_row(session, category_ids[name])
+        change = record_change(session, "category", "delete", name=name)
+        session.commit()
+        version = notify_committed(change)
+        logger.info(f"Merged category '{name}' into '{target_name}' ({moved} products moved)")
+
+        if wants_lean_response():
+            return jsonify({"status": "ok", "merged": name, "into": target_name, "moved": moved, "version": make_etag(version)})
+        return jsonify({"status": "ok", "categories": list_category_names(session), "moved": moved, "version": make_etag(version)})
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error merging category '{name}' into '{target_name}': {e}")
+        return jsonify({"status": "error", "message": "Failed to merge category"}), 500
+    finally:
+        Session.remove()
+
 # -----------------------------
 # Edit Category
 # -----------------------------
@@ -305,12 +807,16 @@ def edit_category(old_name):
 
         # Update the category name
         category.name = new_name
+        change = record_change(session, "category", "update", name=new_name, old_name=old_name)
         session.commit()
+        version = notify_committed(change)
         logger.info(f"Category renamed from '{old_name}' to '{new_name}'")
 
+        if wants_lean_response():
+            return jsonify({"status": "ok", "category": new_name, "version": make_etag(version)})
+
         # Return updated list of categories
-        category_names = [cat.name for cat in session.query(Category).all()]
-        return jsonify({"status": "ok", "categories": category_names})
+        return jsonify({"status": "ok", "categories": list_category_names(session), "version": make_etag(version)})
 
     except ValidationError as err:
         logger.warning("Validation error on editing category: %s", err.messages)
@@ -324,6 +830,27 @@ def edit_category(old_name):
     finally:
         Session.remove()
 
+# -----------------------------
+# Barcode Lookup
+# -----------------------------
+@app.route("/products/by_barcode/<code>", methods=["GET"])
+@conditional_get
+@cached_get("products")
+def get_product_by_barcode(code):
+    """Return the local product with the given barcode, without contacting OpenFoodFacts."""
+    session = Session()
+    try:
+        row = product_listing_query(session).filter(Product.barcode == code).first()
+        if row is None:
+            logger.debug("No local product with barcode %s", code)
+            return jsonify({"status": "error", "message": "Product not found"}), 404
+        return jsonify({"status": "ok", "product": serialize_product_row(row)})
+    except Exception as e:
+        logger.error("Error looking up barcode %s: %s", code, e)
+        return jsonify({"status": "error", "message": "Failed to look up barcode"}), 500
+    finally:
+        Session.remove()
+
 # -----------------------------
 # Edit Product
 # -----------------------------
@@ -416,16 +943,21 @@ def edit_product(old_name):
                 product.barcode = None
                 logger.info(f"Product '{product.name}' barcode removed")
 
+        change = record_change(
+            session, "product", "update", name=product.name,
+            old_name=old_name if product.name != old_name else None
+        )
         session.commit()
+        version = notify_committed(change)
         logger.info(f"Product '{old_name}' edited successfully")
+        if url:
+            thumbnail_cache.prefetch(product.url)
+
+        if wants_lean_response():
+            return jsonify({"status": "ok", "product": serialize_product(product), "version": make_etag(version)})
 
         # Return updated list of products
-        products = session.query(Product).all()
-        product_list = [
-            {"name": prod.name, "url": prod.url, "category": prod.category.name, "barcode": prod.barcode}
-            for prod in products
-        ]
-        return jsonify({"status": "ok", "products": product_list})
+        return jsonify({"status": "ok", "products": list_products(session), "version": make_etag(version)})
 
     except ValidationError as err:
         logger.warning("Validation error on editing product: %s", err.messages)
@@ -442,18 +974,106 @@ def edit_product(old_name):
 # -----------------------------
 # Products
 # -----------------------------
+PRODUCT_PAGE_LIMIT = 500  # Maximum page size for paginated product listings
+# Sort key -> (column expression, index of that value in a product_listing_query row)
+PRODUCT_SORT_COLUMNS = {
+    "id": (Product.id, 0),
+    "name": (Product.name, 1),
+    "category": (Category.name, 3),
+    "count": (func.coalesce(Count.count, 0), 5),
+}
+
+def encode_product_cursor(sort_value, product_id):
+    """Encode the position after the last returned row as an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps([sort_value, product_id]).encode()).decode()
+
+def decode_product_cursor(cursor):
+    """Decode a cursor created by encode_product_cursor. Raises ValueError if it is malformed."""
+    try:
+        sort_value, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    # bool is a subclass of int, but never a valid id or sort value
+    if not isinstance(product_id, int) or isinstance(product_id, bool):
+        raise ValueError("Invalid cursor")
+    if not isinstance(sort_value, (str, int, float)) or isinstance(sort_value, bool):
+        raise ValueError("Invalid cursor")
+    return sort_value, product_id
+
+def query_products(session, args):
+    """
+    List products using keyset pagination, sorting and filtering in one query.
+    Returns (products, next_cursor, total). Raises ValueError for invalid arguments.
+    """
+    sort = args.get("sort", "id")
+    order = args.get("order", "asc").lower()
+    if sort not in PRODUCT_SORT_COLUMNS:
+        raise ValueError(f"sort must be one of: {', '.join(PRODUCT_SORT_COLUMNS)}")
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be asc or desc")
+
+    limit = args.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        if not 1 <= limit <= PRODUCT_PAGE_LIMIT:
+            raise ValueError(f"limit must be between 1 and {PRODUCT_PAGE_LIMIT}")
+
+    query = product_listing_query(session)
+
+    if args.get("category"):
+        query = query.filter(Category.name == args["category"])
+    if args.get("prefix"):
+        escaped = args["prefix"].replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.filter(Product.name.like(f"{escaped}%", escape="\\"))
+    if args.get("barcode"):
+        query = query.filter(Product.barcode == args["barcode"])
+
+    total = query.count()
+
+    sort_column, sort_index = PRODUCT_SORT_COLUMNS[sort]
+    if args.get("cursor"):
+        sort_value, last_id = decode_product_cursor(args["cursor"])
+        if order == "asc":
+            query = query.filter(or_(sort_column > sort_value, and_(sort_column == sort_value, Product.id > last_id)))
+        else:
+            query = query.filter(or_(sort_column < sort_value, and_(sort_column == sort_value, Product.id < last_id)))
+
+    if order == "asc":
+        query = query.order_by(sort_column.asc(), Product.id.asc())
+    else:
+        query = query.order_by(sort_column.desc(), Product.id.desc())
+
+    if limit is None:
+        return [serialize_product_row(row) for row in query], None, total
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_product_cursor(last[sort_index], last[0])
+    return [serialize_product_row(row) for row in rows], next_cursor, total
+
 @app.route("/products", methods=["GET", "POST", "DELETE"])
+@conditional_get
+@cached_get("products")
 def products_route():
     session = Session()
     if request.method == "GET":
         try:
-            products = session.query(Product).all()
-            product_list = [
-                {"name": prod.name, "url": prod.url, "category": prod.category.name, "barcode": prod.barcode}
-                for prod in products
-            ]
-            logger.info("Fetched products: %s", product_list)
-            return jsonify(product_list)
+            product_list, next_cursor, total = query_products(session, request.args)
+            logger.info("Fetched %d of %d products", len(product_list), total)
+
+            # Without pagination parameters keep returning a plain list for existing clients
+            if "limit" not in request.args and "cursor" not in request.args:
+                return jsonify(product_list)
+            return jsonify({"status": "ok", "products": product_list, "next_cursor": next_cursor, "total": total})
+        except ValueError as e:
+            logger.warning("Invalid product listing parameters: %s", e)
+            return jsonify({"status": "error", "message": str(e)}), 400
         except Exception as e:
             logger.error("Error fetching products: %s", e)
             return jsonify({"status": "error", "message": "Failed to fetch products"}), 500
@@ -498,16 +1118,16 @@ def products_route():
             # Initialize count to 0
             new_count = Count(product=new_product, count=0)
             session.add(new_count)
+            change = record_change(session, "product", "create", name=name, count=0)
 
             session.commit()
+            version = notify_committed(change)
             logger.info(f"Added new product: {name}")
+            thumbnail_cache.prefetch(url)
 
-            products = session.query(Product).all()
-            product_list = [
-                {"name": prod.name, "url": prod.url, "category": prod.category.name, "barcode": prod.barcode}
-                for prod in products
-            ]
-            return jsonify({"status": "ok", "products": product_list})
+            if wants_lean_response():
+                return jsonify({"status": "ok", "product": serialize_product(new_product), "version": make_etag(version)})
+            return jsonify({"status": "ok", "products": list_products(session), "version": make_etag(version)})
         except Exception as e:
             session.rollback()
             logger.error("Error adding product '%s': %s", name, e)
@@ -529,15 +1149,14 @@ def products_route():
                 return jsonify({"status": "error", "message": "Product not found"}), 404
 
             session.delete(product)
+            change = record_change(session, "product", "delete", name=product_name)
             session.commit()
+            version = notify_committed(change)
             logger.info(f"Deleted product: {product_name}")
 
-            products = session.query(Product).all()
-            product_list = [
-                {"name": prod.name, "url": prod.url, "category": prod.category.name, "barcode": prod.barcode}
-                for prod in products
-            ]
-            return jsonify({"status": "ok", "products": product_list})
+            if wants_lean_response():
+                return jsonify({"status": "ok", "deleted": product_name, "version": make_etag(version)})
+            return jsonify({"status": "ok", "products": list_products(session), "version": make_etag(version)})
         except Exception as e:
             session.rollback()
             logger.error("Error deleting product '%s': %s", product_name, e)
@@ -545,6 +1164,310 @@ def products_route():
         finally:
             Session.remove()
 
+# -----------------------------
+# Product Images
+# -----------------------------
+# Thumbnails of product images are downloaded once and served from pantry_data/thumbnails
+# (see thumbnails.py), so the product table does not load every image from remote hosts.
+THUMBNAIL_CACHE_DIR = os.path.join(DB_DIR, "thumbnails")
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600  # Seconds browsers keep a versioned thumbnail URL
+
+thumbnail_cache = ThumbnailCache(
+    THUMBNAIL_CACHE_DIR,
+    size=config.getint('Images', 'thumbnail_size', fallback=160),
+    max_bytes=config.getint('Images', 'cache_mb', fallback=50) * 1024 * 1024,
+    timeout=config.getfloat('Images', 'timeout', fallback=5)
+)
+
+@app.route("/products/<name>/image", methods=["GET"])
+def product_image(name):
+    """
+    Serve a thumbnail of the product's image.
+    The ETag is derived from the image URL, so it changes when the product's image is edited.
+    Clients that add ?v=<anything that changes with the URL> get a response cached for a year;
+    without it browsers revalidate every time.
+    If the image cannot be downloaded the client is redirected to the original URL.
+    """
+    session = Session()
+    try:
+        url = session.query(Product.url).filter_by(name=name).scalar()
+    finally:
+        Session.remove()
+    if not url:
+        return jsonify({"status": "error", "message": "Product not found"}), 404
+
+    etag = thumbnail_cache.key_for(url)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        try:
+            response = Response(thumbnail_cache.get(url), mimetype="image/jpeg")
+        except ImageUnavailable:
+            response = redirect(url)
+            response.headers["Cache-Control"] = "no-store"
+            return response
+    response.set_etag(etag)
+    if request.args.get("v"):
+        response.cache_control.public = True
+        response.cache_control.max_age = THUMBNAIL_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+@app.route("/products/images", methods=["GET", "DELETE"])
+def product_images():
+    """Return thumbnail cache statistics for this worker (GET) or delete every cached thumbnail (DELETE)."""
+    try:
+        if request.method == "DELETE":
+            removed = thumbnail_cache.clear()
+            logger.info(f"Removed {removed} cached thumbnails.")
+        return jsonify({"status": "ok", "cache": thumbnail_cache.stats()})
+    except Exception as e:
+        logger.error(f"Error handling the thumbnail cache: {e}")
+        return jsonify({"status": "error", "message": "Failed to process the thumbnail request."}), 500
+
+# -----------------------------
+# Bulk Import / Export
+# -----------------------------
+IMPORT_CHUNK_SIZE = 500  # Rows inserted per executemany batch
+EXPORT_CHUNK_SIZE = 500  # Rows fetched from the database per batch when exporting
+EXPORT_COLUMNS = ["name", "url", "category", "barcode", "image_front_small_url", "count"]
+
+def detect_import_format(stream_name=None):
+    """Work out whether an import is CSV or NDJSON from the query string, file name or content type."""
+    fmt = request.args.get("format")
+    if fmt:
+        return fmt.lower()
+    if stream_name:
+        if stream_name.lower().endswith(".csv"):
+            return "csv"
+        if stream_name.lower().endswith((".ndjson", ".jsonl")):
+            return "ndjson"
+    if request.mimetype == "text/csv":
+        return "csv"
+    if request.mimetype in ("application/x-ndjson", "application/jsonl", "application/json"):
+        return "ndjson"
+    return None
+
+class ReadableStream(io.RawIOBase):
+    """
+    Expose a plain read()-only stream through the io interface TextIOWrapper needs.
+    Under Gunicorn request.stream is the server's own input object, which has no readable().
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+def iter_import_rows(stream, fmt):
+    """
+    Yield (row_number, data, error) for each row of a CSV or NDJSON stream
+    without reading the whole upload into memory. Empty values are dropped
+    so optional fields fall back to their defaults.
+    """
+    if not hasattr(stream, "readable"):
+        stream = io.BufferedReader(ReadableStream(stream))
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        # Row 1 is the header
+        for row_number, row in enumerate(csv.DictReader(text), start=2):
+            yield row_number, {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}, None
+    else:
+        for row_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                yield row_number, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(data, dict):
+                yield row_number, None, "Each line must be a JSON object"
+                continue
+            yield row_number, {key: value for key, value in data.items() if value not in ("", None)}, None
+
+@app.route("/products/import", methods=["POST"])
+def import_products():
+    """
+    Bulk import products from a CSV or NDJSON body (or a multipart upload with key "file").
+    Columns/keys: name, url, category, barcode, image_front_small_url, count
+    Query parameters: format (csv/ndjson, detected from the upload if omitted),
+                      create_categories (true to create missing categories instead of rejecting the row)
+    Valid rows are imported and invalid rows are reported individually.
+    """
+    if "file" in request.files:
+        upload = request.files["file"]
+        stream, fmt = upload.stream, detect_import_format(upload.filename)
+    else:
+        stream, fmt = request.stream, detect_import_format()
+
+    if fmt not in ("csv", "ndjson"):
+        logger.warning("Unsupported import format: %s", fmt)
+        return jsonify({"status": "error", "message": "Format must be csv or ndjson"}), 400
+
+    create_categories = request.args.get("create_categories", "false").lower() == "true"
+
+    session = Session()
+    try:
+        # Load everything needed for uniqueness checks once instead of querying per row
+        category_ids = dict(session.query(Category.name, Category.id).all())
+        existing_names = {name for (name,) in session.query(Product.name)}
+        existing_barcodes = {barcode for (barcode,) in session.query(Product.barcode).filter(Product.barcode.isnot(None))}
+
+        schema = ImportProductSchema()
+        errors = []
+        pending = []
+        created_categories = []
+        imported = 0
+
+        def insert_pending():
+            session.execute(Product.__table__.insert(), [
+                {
+                    "name": row["name"],
+                    "url": row["url"],
+                    "category_id": category_ids[row["category"]],
+                    "barcode": row.get("barcode"),
+                    "image_front_small_url": row.get("image_front_small_url"),
+                }
+                for row in pending
+            ])
+            product_ids = dict(
+                session.query(Product.name, Product.id).filter(Product.name.in_([row["name"] for row in pending]))
+            )
+            session.execute(Count.__table__.insert(), [
+                {"product_id": product_ids[row["name"]], "count": row["count"]} for row in pending
+            ])
+            session.execute(ChangeLog.__table__.insert(), [
+                {"entity_type": "product", "action": "create", "name": row["name"], "count": row["count"]}
+                for row in pending
+            ])
+            pending.clear()
+
+        for row_number, raw, error in iter_import_rows(stream, fmt):
+            if error:
+                errors.append({"row": row_number, "message": error})
+                continue
+            try:
+                row = schema.load(raw)
+            except ValidationError as err:
+                errors.append({"row": row_number, "errors": err.messages})
+                continue
+
+            if row["name"] in existing_names:
+                errors.append({"row": row_number, "message": "Duplicate product"})
+                continue
+            if row.get("barcode") and row["barcode"] in existing_barcodes:
+                errors.append({"row": row_number, "message": "Barcode already exists"})
+                continue
+            if row["category"] not in category_ids:
+                if not create_categories:
+                    errors.append({"row": row_number, "message": "Category does not exist"})
+                    continue
+                new_category = Category(name=row["category"])
+                session.add(new_category)
+                session.flush()
+                record_change(session, "category", "create", name=new_category.name)
+                category_ids[new_category.name] = new_category.id
+                created_categories.append(new_category.name)
+
+            existing_names.add(row["name"])
+            if row.get("barcode"):
+                existing_barcodes.add(row["barcode"])
+            pending.append(row)
+            imported += 1
+            if len(pending) >= IMPORT_CHUNK_SIZE:
+                insert_pending()
+
+        if pending:
+            insert_pending()
+
+        if imported or created_categories:
+            latest_id = session.query(func.max(ChangeLog.id)).scalar()
+            compact_change_log(session, latest_id)
+        session.commit()
+
+        if imported or created_categories:
+            # Large imports reach subscribers as a single "backlog" resync from the change watcher
+            bump_data_version(*CACHE_GROUPS)
+
+        logger.info("Imported %d products (%d rows failed)", imported, len(errors))
+        return jsonify({
+            "status": "ok" if not errors else "partial",
+            "imported": imported,
+            "failed": len(errors),
+            "created_categories": created_categories,
+            "errors": errors
+        })
+
+    except Exception as e:
+        session.rollback()
+        logger.error("Error importing products: %s", e)
+        return jsonify({"status": "error", "message": "Failed to import products"}), 500
+
+    finally:
+        Session.remove()
+
+@app.route("/products/export", methods=["GET"])
+@conditional_get
+def export_products():
+    """
+    Stream all products as CSV or NDJSON.
+    Query parameters: format (csv or ndjson, default csv)
+    """
+    fmt = request.args.get("format", "csv").lower()
+    if fmt not in ("csv", "ndjson"):
+        logger.warning("Unsupported export format: %s", fmt)
+        return jsonify({"status": "error", "message": "Format must be csv or ndjson"}), 400
+
+    def generate():
+        session = Session()
+        try:
+            rows = (
+                session.query(
+                    Product.name, Product.url, Category.name, Product.barcode,
+                    Product.image_front_small_url, Count.count
+                )
+                .join(Category, Product.category_id == Category.id)
+                .outerjoin(Count, Count.product_id == Product.id)
+                .order_by(Product.name)
+                .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+            )
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if fmt == "csv":
+                writer.writerow(EXPORT_COLUMNS)
+
+            for index, row in enumerate(rows, start=1):
+                values = list(row[:-1]) + [row[-1] or 0]
+                if fmt == "csv":
+                    writer.writerow(["" if value is None else value for value in values])
+                else:
+                    buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, values))) + "\n")
+
+                if index % EXPORT_CHUNK_SIZE == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate(0)
+
+            yield buffer.getvalue()
+        finally:
+            Session.remove()
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    logger.info("Streaming product export as %s", fmt)
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename=products.{fmt}"
+    return response
+
 # -----------------------------
 # Update Count
 # -----------------------------
@@ -553,23 +1476,26 @@ def update_count():
     session = Session()
     data = request.get_json()
     product_name = data.get("product_name")
+    barcode = data.get("barcode")
     action = data.get("action")
     amount = data.get("amount", 1)
 
-    if not all([product_name, action]):
+    # Products can be addressed by name or, from a scanner, by barcode
+    if not all([product_name or barcode, action]):
         logger.warning("Missing required parameters in update_count")
         return jsonify({"status": "error", "message": "Missing required parameters"}), 400
 
     try:
-        product = session.query(Product).filter_by(name=product_name).first()
+        product = lookup_product(session, name=product_name, barcode=barcode)
         if not product:
-            logger.warning("Product '%s' not found in update_count", product_name)
+            logger.warning("Product '%s' not found in update_count", product_name or barcode)
             return jsonify({"status": "error", "message": "Product not found"}), 404
+        product_id, product_name = product
 
-        count_entry = session.query(Count).filter_by(product_id=product.id).first()
+        count_entry = session.query(Count).filter_by(product_id=product_id).first()
         if not count_entry:
             # Initialize count if it doesn't exist
-            count_entry = Count(product=product, count=0)
+            count_entry = Count(product_id=product_id, count=0)
             session.add(count_entry)
 
         if action == "increase":
@@ -580,30 +1506,148 @@ def update_count():
             logger.warning("Invalid action '%s' in update_count", action)
             return jsonify({"status": "error", "message": "Invalid action"}), 400
 
+        change = record_change(session, "count", "update", name=product_name, count=count_entry.count)
         session.commit()
+        notify_committed(change)
         logger.info("Updated count for %s: %s", product_name, count_entry.count)
-        return jsonify({"status": "ok", "count": count_entry.count})
+        return jsonify({"status": "ok", "product_name": product_name, "count": count_entry.count})
 
     except Exception as e:
         session.rollback()
-        logger.error("Error updating count for %s: %s", product_name, e)
+        logger.error("Error updating count for %s: %s", product_name or barcode, e)
         return jsonify({"status": "error", "message": "Failed to update count"}), 500
 
     finally:
         Session.remove()
 
+# -----------------------------
+# Batch Update Counts
+# -----------------------------
+MAX_BATCH_OPERATIONS = 500  # Maximum number of operations accepted by /update_counts
+
+@app.route("/update_counts", methods=["POST"])
+def update_counts():
+    """
+    Apply many count updates in a single transaction.
+    Payload:
+    {
+      "operations": [
+        {"product_name": "Apple", "action": "increase", "amount": 2},
+        {"barcode": "12345678", "action": "decrease"}
+      ],
+      "atomic": true
+    }
+    With "atomic" (the default) nothing is applied if any operation fails.
+    Otherwise valid operations are applied and failed ones are reported.
+    """
+    data = request.get_json(silent=True) or {}
+    operations = data.get("operations")
+    atomic = data.get("atomic", True)
+
+    if not isinstance(operations, list) or not operations:
+        logger.warning("Missing operations in update_counts")
+        return jsonify({"status": "error", "message": "operations must be a non-empty list"}), 400
+
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        logger.warning("Too many operations in update_counts: %d", len(operations))
+        return jsonify({"status": "error", "message": f"A maximum of {MAX_BATCH_OPERATIONS} operations is allowed"}), 400
+
+    # Validate every operation up front
+    schema = CountOperationSchema()
+    results = []
+    valid_operations = []
+    for index, operation in enumerate(operations):
+        try:
+            valid_operations.append((index, schema.load(operation if isinstance(operation, dict) else {})))
+            results.append(None)
+        except ValidationError as err:
+            results.append({"index": index, "status": "error", "errors": err.messages})
+
+    session = Session()
+    try:
+        # Resolve every referenced product and its count in one query
+        names = {op["product_name"] for _, op in valid_operations if op.get("product_name")}
+        barcodes = {op["barcode"] for _, op in valid_operations if op.get("barcode")}
+        rows = (
+            session.query(Product, Count)
+            .outerjoin(Count, Count.product_id == Product.id)
+            .filter(or_(Product.name.in_(names), Product.barcode.in_(barcodes)))
+            .all()
+        )
+        by_name = {product.name: (product, count) for product, count in rows}
+        by_barcode = {product.barcode: (product, count) for product, count in rows if product.barcode}
+
+        touched = {}
+        for index, op in valid_operations:
+            if op.get("product_name"):
+                found = by_name.get(op["product_name"])
+            else:
+                found = by_barcode.get(op["barcode"])
+            if not found:
+                results[index] = {"index": index, "status": "error", "message": "Product not found"}
+                continue
+
+            product, count_entry = found
+            if count_entry is None:
+                # Initialize count if it doesn't exist
+                count_entry = Count(product=product, count=0)
+                session.add(count_entry)
+                by_name[product.name] = (product, count_entry)
+                if product.barcode:
+                    by_barcode[product.barcode] = (product, count_entry)
+
+            if op["action"] == "increase":
+                count_entry.count += op["amount"]
+            else:
+                count_entry.count = max(count_entry.count - op["amount"], 0)
+
+            touched[product.name] = count_entry
+            results[index] = {"index": index, "status": "ok", "product_name": product.name, "count": count_entry.count}
+
+        failed = sum(1 for result in results if result["status"] == "error")
+        if failed and atomic:
+            session.rollback()
+            results = [
+                result if result["status"] == "error" else {"index": result["index"], "status": "skipped"}
+                for result in results
+            ]
+            logger.warning("Rejected batch count update: %d of %d operations failed", failed, len(operations))
+            return jsonify({"status": "error", "message": "No counts were updated", "results": results}), 400
+
+        # One change log entry per product, holding its final count
+        changes = [
+            record_change(session, "count", "update", name=name, count=count_entry.count)
+            for name, count_entry in touched.items()
+        ]
+        counts = {sanitize_entity_id(name): count_entry.count for name, count_entry in touched.items()}
+        session.commit()
+        if changes:
+            notify_committed(*changes)
+        logger.info("Batch updated counts for %d products (%d operations failed)", len(touched), failed)
+        return jsonify({"status": "ok" if not failed else "partial", "results": results, "counts": counts})
+
+    except Exception as e:
+        session.rollback()
+        logger.error("Error applying batch count update: %s", e)
+        return jsonify({"status": "error", "message": "Failed to update counts"}), 500
+
+    finally:
+        Session.remove()
+
 # -----------------------------
 # Get Counts
 # -----------------------------
 @app.route("/counts", methods=["GET"])
+@conditional_get
+@cached_get("counts")
 def get_counts():
     session = Session()
     try:
         counts = {}
-        entries = session.query(Count).join(Product).all()
-        for entry in entries:
-            entity_id = sanitize_entity_id(entry.product.name)
-            counts[entity_id] = entry.count
+        # One query for every row: ix_counts_product_id_count covers the counts side of the join
+        rows = session.query(Product.name, Count.count).join(Count, Count.product_id == Product.id)
+        for name, count in rows:
+            counts[sanitize_entity_id(name)] = count
         logger.info("Fetched counts: %s", counts)
         return jsonify(counts)
     except Exception as e:
@@ -612,6 +1656,187 @@ def get_counts():
     finally:
         Session.remove()
 
+# -----------------------------
+# Count Changes (Delta Feed)
+# -----------------------------
+@app.route("/counts/changes", methods=["GET"])
+@conditional_get
+def get_count_changes():
+    """
+    Return the changes committed after the client's cursor.
+    Query parameters: since (cursor returned by a previous call, default 0), limit (default 500)
+    If the cursor is older than the retained log or belongs to a replaced database,
+    "resync" is true and the client should reload the full snapshot from /counts.
+    """
+    try:
+        since = int(request.args.get("since", 0))
+        limit = min(int(request.args.get("limit", CHANGES_PAGE_LIMIT)), CHANGES_PAGE_LIMIT)
+    except ValueError:
+        logger.warning("Invalid cursor or limit in count changes request")
+        return jsonify({"status": "error", "message": "since and limit must be integers"}), 400
+
+    if since < 0 or limit < 1:
+        logger.warning("Out of range cursor or limit in count changes request")
+        return jsonify({"status": "error", "message": "since must be >= 0 and limit >= 1"}), 400
+
+    session = Session()
+    try:
+        oldest_id, latest_id = session.query(func.min(ChangeLog.id), func.max(ChangeLog.id)).one()
+        latest_id = latest_id or 0
+
+        # Entries between the cursor and the oldest retained entry have been compacted,
+        # and a cursor ahead of the log can only come from a database that has since been replaced
+        resync = since > latest_id or (oldest_id is not None and since < oldest_id - 1)
+
+        entries = []
+        if not resync:
+            entries = (
+                session.query(ChangeLog)
+                .filter(ChangeLog.id > since)
+                .order_by(ChangeLog.id)
+                .limit(limit)
+                .all()
+            )
+            resync = any(entry.entity_type == "database" and entry.action == "reset" for entry in entries)
+
+        if resync:
+            logger.info("Count changes since %s require a resync", since)
+            return jsonify({"status": "ok", "resync": True, "cursor": latest_id, "has_more": False, "changes": []})
+
+        cursor = entries[-1].id if entries else since
+        logger.debug("Returning %d changes since %s", len(entries), since)
+        return jsonify({
+            "status": "ok",
+            "resync": False,
+            "cursor": cursor,
+            "has_more": cursor < latest_id,
+            "changes": [serialize_change(entry) for entry in entries]
+        })
+    except Exception as e:
+        logger.error("Error fetching count changes: %s", e)
+        return jsonify({"status": "error", "message": "Failed to fetch count changes"}), 500
+    finally:
+        Session.remove()
+
+# -----------------------------
+# Change Events (Push)
+# -----------------------------
+@app.route("/events", methods=["GET"])
+def events():
+    """
+    Stream committed changes using Server-Sent Events.
+    Each "change" event carries the same payload as /counts/changes plus the new data version.
+    A "resync" event means events were dropped or the database was replaced and the
+    client should reload its data. Events are published by the change watcher, so they
+    arrive up to CHANGE_WATCH_INTERVAL seconds after the write, from whichever worker made it.
+    """
+    ensure_change_watcher()
+    try:
+        subscriber = event_broker.subscribe()
+    except SubscriberLimitReached:
+        logger.warning("Event stream rejected. Subscriber limit of %d reached.", EVENT_MAX_SUBSCRIBERS)
+        return jsonify({"status": "error", "message": "Too many event subscribers."}), 503
+
+    response = Response(
+        event_broker.stream(subscriber, EVENT_HEARTBEAT_INTERVAL),
+        mimetype="text/event-stream"
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # Disable proxy buffering
+    return response
+
+@app.route("/events/poll", methods=["GET"])
+def poll_events():
+    """
+    Long-poll fallback for clients that cannot use Server-Sent Events.
+    Query parameters: version (value returned by the previous call), timeout (seconds, max 30)
+    Returns as soon as the data version differs from the one supplied, or when the timeout expires.
+    """
+    client_version = request.args.get("version", "")
+    try:
+        timeout = min(max(float(request.args.get("timeout", LONG_POLL_TIMEOUT)), 0), LONG_POLL_TIMEOUT)
+    except ValueError:
+        logger.warning("Invalid timeout in long-poll request")
+        return jsonify({"status": "error", "message": "timeout must be a number"}), 400
+
+    ensure_change_watcher()
+    try:
+        subscriber = event_broker.subscribe()
+    except SubscriberLimitReached:
+        logger.warning("Long-poll rejected. Subscriber limit of %d reached.", EVENT_MAX_SUBSCRIBERS)
+        return jsonify({"status": "error", "message": "Too many event subscribers."}), 503
+
+    try:
+        changed = event_broker.wait_for(lambda: make_etag(get_data_version()) != client_version, timeout)
+    finally:
+        event_broker.unsubscribe(subscriber)
+
+    return jsonify({"status": "ok", "changed": changed, "version": make_etag(get_data_version())})
+
+# -----------------------------
+# Database Settings
+# -----------------------------
+@app.route("/database/settings", methods=["GET"])
+def database_settings():
+    """Return the configured SQLite settings and the values active on a live connection."""
+    try:
+        active = read_sqlite_pragmas(engine, SQLITE_PRAGMAS.keys())
+        return jsonify({"status": "ok", "configured": SQLITE_PRAGMAS, "active": active})
+    except Exception as e:
+        logger.error(f"Error reading database settings: {e}")
+        return jsonify({"status": "error", "message": "Failed to read database settings."}), 500
+
+# -----------------------------
+# Cache Statistics
+# -----------------------------
+@app.route("/cache", methods=["GET", "DELETE"])
+def cache_route():
+    """
+    Return this worker's response cache statistics (GET) or drop every cached entry (DELETE).
+    DELETE bumps every cache group version, so the entries are dropped in all worker processes.
+    """
+    if request.method == "DELETE":
+        response_cache.clear()
+        bump_data_version(*CACHE_GROUPS)
+        logger.info("Response cache cleared on request.")
+    return jsonify({"status": "ok", "cache": response_cache.stats()})
+
+# -----------------------------
+# Snapshots
+# -----------------------------
+@app.route("/backups", methods=["GET", "POST"])
+def backups():
+    """List snapshots with the schedule and retention settings (GET) or take a snapshot now (POST)."""
+    try:
+        if request.method == "POST":
+            backup = backup_manager.create_snapshot()
+            return jsonify({"status": "ok", "backup": backup})
+        return jsonify({
+            "status": "ok",
+            "settings": backup_manager.settings(),
+            "backups": backup_manager.list_snapshots()
+        })
+    except Exception as e:
+        logger.error(f"Error handling snapshots: {e}")
+        return jsonify({"status": "error", "message": "Failed to process the snapshot request."}), 500
+
+@app.route("/backups/latest", methods=["GET"])
+def download_latest_backup():
+    """Download the most recent snapshot."""
+    snapshots = backup_manager.list_snapshots()
+    if not snapshots:
+        return jsonify({"status": "error", "message": "No snapshots found."}), 404
+    return download_backup(snapshots[0]["name"])
+
+@app.route("/backups/<name>", methods=["GET"])
+def download_backup(name):
+    """Download a snapshot by name."""
+    path = backup_manager.snapshot_path(name)
+    if path is None:
+        logger.warning(f"Snapshot not found: {name}")
+        return jsonify({"status": "error", "message": "Snapshot not found."}), 404
+    return send_file(path, as_attachment=True, download_name=name)
+
 @app.route("/health", methods=["GET"])
 def health():
     """Health check endpoint."""
@@ -621,6 +1846,17 @@ def health():
 # -----------------------------
 # Backup & Restore
 # -----------------------------
+# Snapshots are written with VACUUM INTO (see backups.py), which does not block writers.
+# Scheduling and retention are configured in the [Backups] section of config.ini.
+backup_manager = BackupManager(
+    DB_FILE,
+    os.path.join(DB_DIR, "backups"),
+    interval_hours=config.getfloat('Backups', 'schedule_hours', fallback=24),
+    retain_count=config.getint('Backups', 'retain_count', fallback=7),
+    retain_days=config.getint('Backups', 'retain_days', fallback=30),
+    compress=config.getboolean('Backups', 'compress', fallback=False)
+)
+
 @app.route("/backup", methods=["GET"], endpoint="backup_page")
 def backup():
     # Typically not used if in single-page approach, but leaving it
@@ -634,56 +1870,214 @@ def backup():
 def download_db():
     if os.path.exists(DB_FILE):
         logger.info("Database file requested for download.")
-        return send_file(DB_FILE, as_attachment=True, download_name="pantry_data.db")
+        # Serve a consistent snapshot rather than the live file, which may be mid-write
+        snapshot_file = os.path.join(DB_DIR, f"download_{secrets.token_hex(8)}.db")
+        try:
+            snapshot_database(DB_FILE, snapshot_file)
+        except Exception as e:
+            logger.error(f"Error creating a snapshot for download: {e}")
+            if os.path.exists(snapshot_file):
+                os.remove(snapshot_file)
+            return "Failed to create a database snapshot.", 500
+        # The open handle keeps the data readable after the file is removed
+        snapshot = open(snapshot_file, "rb")
+        os.remove(snapshot_file)
+        return send_file(snapshot, as_attachment=True, download_name="pantry_data.db",
+                         mimetype="application/octet-stream")
     else:
         logger.warning("Database file not found for download.")
         return "Database file not found.", 404
 
-@app.route("/upload_db", methods=["POST"])
-def upload_db():
-    global engine, Session  # Declare as global to modify the global variables
-
-    if 'file' not in request.files:
-        logger.warning("No file part in the upload_db request.")
-        return jsonify({"status": "error", "message": "No file part in the request."}), 400
+# Uploads are streamed straight to a temporary file next to the database, validated,
+# migrated only when the schema is out of date, and then copied into the live database
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Bytes read from a raw request body at a time
+UPLOAD_PROGRESS_EVERY = 4 * 1024 * 1024  # Bytes received between progress updates
+MAX_UPLOAD_BYTES = config.getint('Backups', 'max_upload_mb', fallback=100) * 1024 * 1024
+UPLOAD_PROGRESS_FILE = os.path.join(DB_DIR, "upload_progress.json")
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES."""
+
+def write_upload_progress(stage, received=0, total=None, message=None):
+    """Record the state of the current upload in a file, so whichever worker is asked can report it."""
+    progress = {
+        "stage": stage,
+        "received": received,
+        "total": total,
+        "message": message,
+        "updated_at": datetime.datetime.now().isoformat(),
+    }
+    temp_path = UPLOAD_PROGRESS_FILE + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(progress, f)
+    os.replace(temp_path, UPLOAD_PROGRESS_FILE)
+
+class UploadWriter:
+    """Write an upload to disk as it arrives, enforcing the size limit and reporting progress."""
+
+    def __init__(self, path, total=None):
+        self.path = path
+        self.total = total
+        self.received = 0
+        self._reported = 0
+        self._file = open(path, "wb")
+
+    def write(self, data):
+        self.received += len(data)
+        if self.received > MAX_UPLOAD_BYTES:
+            raise UploadTooLarge()
+        self._file.write(data)
+        if self.received - self._reported >= UPLOAD_PROGRESS_EVERY:
+            self._reported = self.received
+            write_upload_progress("receiving", self.received, self.total)
+        return len(data)
+
+    def seek(self, offset, whence=0):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+def receive_upload(temp_db_path):
+    """
+    Stream the uploaded database to temp_db_path.
+    Accepts a multipart form with a 'file' field (the backup page) or the raw file as the
+    request body. Returns the uploaded file name, or None if no file was sent.
+    """
+    total = request.content_length
+    if request.mimetype == "multipart/form-data":
+        writers = []
 
-    file = request.files['file']
-    if file.filename == '':
-        logger.warning("No file selected in the upload_db request.")
-        return jsonify({"status": "error", "message": "No file selected."}), 400
+        def stream_factory(total_content_length, content_type, filename, content_length=None):
+            if writers:
+                raise ValueError("Only one file can be uploaded.")
+            writers.append(UploadWriter(temp_db_path, total))
+            return writers[0]
 
-    # Save the uploaded database file
-    temp_db_path = os.path.join(DB_DIR, "uploaded_temp.db")
-    file.save(temp_db_path)
-    logger.debug(f"Uploaded database saved temporarily at: {temp_db_path}")
+        try:
+            _, _, files = parse_form_data(request.environ, stream_factory=stream_factory, silent=False)
+        finally:
+            for writer in writers:
+                writer.close()
+        file = files.get('file')
+        return file.filename if file is not None and writers else None
 
-    # Validate and migrate the uploaded database
+    writer = UploadWriter(temp_db_path, total)
     try:
-        migrate_database(temp_db_path)
-        logger.info("Uploaded database migrated successfully.")
-    except Exception as e:
-        logger.error(f"Error migrating the uploaded database: {e}")
-        os.remove(temp_db_path)
-        return jsonify({"status": "error", "message": "Failed to migrate the uploaded database."}), 500
+        while True:
+            chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            writer.write(chunk)
+    finally:
+        writer.close()
+    return "pantry_data.db" if writer.received else None
+
+@app.route("/upload_db", methods=["POST"])
+def upload_db():
+    """
+    Replace the database with an uploaded one. The upload is streamed to disk, checked with
+    PRAGMA quick_check and the schema version, and migrated only if it is out of date.
+    Multipart uploads from the backup page are redirected, raw uploads get a JSON response.
+    """
+    from_form = request.mimetype == "multipart/form-data"
+    if request.content_length and request.content_length > MAX_UPLOAD_BYTES + UPLOAD_CHUNK_SIZE:
+        logger.warning(f"Database upload of {request.content_length} bytes rejected.")
+        return jsonify({"status": "error", "message": f"The file exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit."}), 413
 
-    # Replace the current database with the uploaded one
+    temp_db_path = os.path.join(DB_DIR, f"uploaded_{secrets.token_hex(8)}.db")
     try:
-        os.replace(temp_db_path, DB_FILE)
-        logger.info("Uploaded database successfully replaced the existing database.")
-    except Exception as e:
-        logger.error(f"Error replacing the database: {e}")
-        return jsonify({"status": "error", "message": "Failed to replace the database."}), 500
+        # Receive the uploaded database file
+        write_upload_progress("receiving", 0, request.content_length)
+        try:
+            filename = receive_upload(temp_db_path)
+        except UploadTooLarge:
+            logger.warning("Database upload exceeded the size limit.")
+            write_upload_progress("failed", message="The file is too large.")
+            return jsonify({"status": "error", "message": f"The file exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit."}), 413
+        except ValueError as e:
+            logger.warning(f"Malformed database upload: {e}")
+            write_upload_progress("failed", message=str(e))
+            return jsonify({"status": "error", "message": "Malformed upload."}), 400
+
+        if not filename or not os.path.exists(temp_db_path):
+            logger.warning("No file selected in the upload_db request.")
+            write_upload_progress("failed", message="No file selected.")
+            return jsonify({"status": "error", "message": "No file selected."}), 400
+        size = os.path.getsize(temp_db_path)
+        logger.debug(f"Uploaded database ({size} bytes) saved temporarily at: {temp_db_path}")
+
+        # Validate before anything is rewritten
+        write_upload_progress("validating", size, size)
+        try:
+            schema_version = check_database_file(temp_db_path)
+        except InvalidDatabase as e:
+            logger.warning(f"Uploaded database rejected: {e}")
+            write_upload_progress("failed", size, size, str(e))
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        # Migrate only when the schema is out of date
+        migrated = False
+        if schema_version < SCHEMA_VERSION:
+            write_upload_progress("migrating", size, size)
+            try:
+                migrated = migrate_database(temp_db_path)
+                logger.info("Uploaded database migrated successfully.")
+            except Exception as e:
+                logger.error(f"Error migrating the uploaded database: {e}")
+                write_upload_progress("failed", size, size, "Failed to migrate the uploaded database.")
+                return jsonify({"status": "error", "message": "Failed to migrate the uploaded database."}), 500
 
-    # Reinitialize the database session
+        # Replace the current database contents with the uploaded one
+        write_upload_progress("restoring", size, size)
+        try:
+            # Converted before the gate is taken, so requests are not held up by the rebuild
+            match_page_size(temp_db_path, read_page_size(DB_FILE))
+        except Exception as e:
+            logger.warning(f"Could not convert the page size of the uploaded database: {e}")
+            write_upload_progress("failed", size, size, "The uploaded database could not be converted.")
+            return jsonify({"status": "error", "message": "The uploaded database could not be converted."}), 400
+        try:
+            with database_gate.exclusive(DATABASE_DRAIN_TIMEOUT):
+                restore_database(engine, temp_db_path)
+                invalidate_swapped_data()
+            logger.info("Uploaded database successfully replaced the existing database.")
+        except PageSizeMismatch as e:
+            # Only if the live page size changed since the conversion above
+            logger.warning(f"Uploaded database rejected: {e}")
+            write_upload_progress("failed", size, size, str(e))
+            return jsonify({"status": "error", "message": str(e)}), 400
+        except DatabaseBusy as e:
+            logger.warning(f"Database upload rejected: {e}")
+            write_upload_progress("failed", size, size, "The database is busy.")
+            return jsonify({"status": "error", "message": "The database is busy. Try again shortly."}), 503
+        except Exception as e:
+            logger.error(f"Error replacing the database: {e}")
+            write_upload_progress("failed", size, size, "Failed to replace the database.")
+            return jsonify({"status": "error", "message": "Failed to replace the database."}), 500
+    finally:
+        if os.path.exists(temp_db_path):
+            os.remove(temp_db_path)
+
+    # Drop the connections opened before the swap and tell clients to resync
     try:
-        engine.dispose()
-        engine = create_engine(f'sqlite:///{DB_FILE}', connect_args={'check_same_thread': False}, echo=False)
-        SessionFactory = sessionmaker(bind=engine)
-        Session = scoped_session(SessionFactory)
+        refresh_engine_pool()
+        record_database_reset()
         logger.info("Database session reinitialized after upload.")
     except Exception as e:
         logger.error(f"Error reinitializing the database session: {e}")
+        write_upload_progress("failed", size, size, "Failed to reinitialize the database.")
         return jsonify({"status": "error", "message": "Failed to reinitialize the database."}), 500
+    write_upload_progress("done", size, size)
+
+    if not from_form:
+        return jsonify({"status": "ok", "size": size, "schema_version": schema_version, "migrated": migrated})
 
     ingress_prefix = request.headers.get("X-Ingress-Path", "")
     if not ingress_prefix.endswith("/"):
@@ -707,65 +2101,202 @@ def upload_db():
     </html>
     """
 
+@app.route("/upload_db/progress", methods=["GET"])
+def upload_db_progress():
+    """Report the stage of the most recent database upload."""
+    try:
+        with open(UPLOAD_PROGRESS_FILE) as f:
+            progress = json.load(f)
+    except (OSError, ValueError):
+        progress = {"stage": "idle"}
+    return jsonify({"status": "ok", "progress": progress})
+
 # ------------------------------------------------
 # OpenFoodFacts Integration
 # ------------------------------------------------
+# Lookups are cached in the openfoodfacts_cache table (see openfoodfacts.py). Settings live
+# in the [OpenFoodFacts] section of config.ini; base_url can point at a local stub server.
+openfoodfacts_client = OpenFoodFactsClient(
+    base_url=config.get('OpenFoodFacts', 'base_url', fallback=DEFAULT_BASE_URL),
+    timeout=config.getfloat('OpenFoodFacts', 'timeout', fallback=5),
+    max_connections=config.getint('OpenFoodFacts', 'max_connections', fallback=4),
+    retries=config.getint('OpenFoodFacts', 'retries', fallback=2),
+    failure_threshold=config.getint('OpenFoodFacts', 'failure_threshold', fallback=5),
+    reset_seconds=config.getfloat('OpenFoodFacts', 'reset_seconds', fallback=30)
+)
+
 def fetch_product_from_openfoodfacts(barcode: str):
-    """Fetch product data from OpenFoodFacts using the barcode."""
-    url = f"https://world.openfoodfacts.org/api/v0/product/{barcode}.json"
-    headers = { "User-Agent": "PantryManager/1.0.5 (mint@mintcreg.co.uk)" }
-    try:
-        response = requests.get(url, headers=headers, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        if data.get('status') == 1:
-            product_data = data.get('product', {})
-            extracted_data = {
-                "name": product_data.get('product_name', 'Unknown Product'),
-                "barcode": barcode,
-                "category": product_data.get('categories', 'Uncategorized').split(',')[0].strip(),
-                "image_front_small_url": product_data.get('image_front_small_url', None)
-            }
-            logger.info(f"Product fetched from OpenFoodFacts: {extracted_data}")
-            return extracted_data
-        else:
-            logger.warning(f"Product with barcode {barcode} not found in OpenFoodFacts.")
-            return None
-    except requests.RequestException as e:
-        logger.error(f"Error fetching product from OpenFoodFacts: {e}")
-        return None
-
-@app.route("/fetch_product", methods=["GET"])
-def fetch_product():
+    """Fetch product data from OpenFoodFacts using the barcode. Returns None if it is unknown."""
+    return openfoodfacts_client.fetch_product(barcode)
+
+product_lookup_cache = ProductLookupCache(
+    Session,
+    fetch_product_from_openfoodfacts,
+    positive_ttl=datetime.timedelta(hours=config.getfloat('OpenFoodFacts', 'cache_ttl_hours', fallback=720)),
+    negative_ttl=datetime.timedelta(hours=config.getfloat('OpenFoodFacts', 'negative_ttl_hours', fallback=24))
+)
+
+@app.route("/fetch_product", methods=["GET"], endpoint="fetch_product")
+def fetch_product_route():
     barcode = request.args.get('barcode')
     if not barcode:
         logger.warning("Barcode not provided in fetch_product request.")
         return jsonify({"status": "error", "message": "Barcode is required"}), 400
 
-    product_data = fetch_product_from_openfoodfacts(barcode)
+    try:
+        product_data, source = product_lookup_cache.lookup(barcode)
+    except LookupFailed:
+        return jsonify({"status": "error", "message": "Failed to reach OpenFoodFacts"}), 502
+    except Exception as e:
+        logger.exception(f"Error looking up barcode {barcode}: {e}")
+        return jsonify({"status": "error", "message": "Failed to fetch product"}), 500
+
     if product_data:
-        return jsonify({"status": "ok", "product": product_data})
+        return jsonify({"status": "ok", "product": product_data, "source": source})
     else:
-        return jsonify({"status": "error", "message": "Product not found or failed to fetch data"}), 404
+        return jsonify({"status": "error", "message": "Product not found", "source": source}), 404
+
+@app.route("/fetch_product/cache", methods=["GET", "DELETE"])
+def fetch_product_cache():
+    """
+    Return OpenFoodFacts lookup cache and upstream client statistics (GET),
+    or delete every cached lookup (DELETE).
+    """
+    try:
+        if request.method == "DELETE":
+            removed = product_lookup_cache.clear()
+            logger.info(f"Removed {removed} cached OpenFoodFacts lookups.")
+        return jsonify({
+            "status": "ok",
+            "cache": product_lookup_cache.stats(),
+            "upstream": openfoodfacts_client.stats()
+        })
+    except Exception as e:
+        logger.error(f"Error handling the OpenFoodFacts cache: {e}")
+        return jsonify({"status": "error", "message": "Failed to process the cache request."}), 500
 
 # ------------------------------------------------
-# Delete Database
+# Bulk Enrichment
 # ------------------------------------------------
-# Import FileLock and Timeout at the top if not already done
-# from filelock import FileLock, Timeout  # Already imported above
+# Fills in missing images of products that have a barcode from OpenFoodFacts in a background
+# job (see enrichment.py). Lookups go through the lookup cache and are rate limited.
+ENRICHMENT_CONCURRENCY = config.getint('Enrichment', 'concurrency', fallback=4)
+ENRICHMENT_RATE = config.getfloat('Enrichment', 'requests_per_second', fallback=1.5)
+ENRICHMENT_BATCH_SIZE = 50  # Products looked up and written per transaction
+
+enrichment_job = EnrichmentJob(DB_DIR)
+
+def products_missing_metadata(session, overwrite=False, limit=None):
+    """Return (id, barcode) pairs of products with a barcode whose image is missing (or all of them with overwrite)."""
+    query = session.query(Product.id, Product.barcode).filter(Product.barcode.isnot(None), Product.barcode != "")
+    if not overwrite:
+        query = query.filter(or_(
+            Product.image_front_small_url.is_(None),
+            Product.image_front_small_url == "",
+            Product.url == ""
+        ))
+    query = query.order_by(Product.id)
+    if limit:
+        query = query.limit(limit)
+    return [(row.id, row.barcode) for row in query]
+
+def make_enrichment_writer(generation, overwrite):
+    """
+    Build the batch writer for a job started at the given database generation.
+    Each batch holds the database gate, and the job stops if the database was replaced,
+    because its product ids would no longer refer to the same products.
+    """
+    def apply_batch(results):
+        database_gate.acquire_shared(DATABASE_SWAP_WAIT)
+        try:
+            if database_gate.generation != generation:
+                raise RuntimeError("The database was replaced while the job was running.")
+            session = Session()
+            try:
+                data_by_id = dict(results)
+                changes = []
+                for product in session.query(Product).filter(Product.id.in_(data_by_id)):
+                    image = data_by_id[product.id].get("image_front_small_url")
+                    if not image:
+                        continue
+                    if overwrite or not product.image_front_small_url:
+                        product.image_front_small_url = image
+                    if overwrite or not product.url:
+                        product.url = image
+                    if session.is_modified(product):
+                        changes.append(record_change(session, "product", "update", name=product.name))
+                session.commit()
+                if changes:
+                    notify_committed(*changes)
+                return len(changes)
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                Session.remove()
+        finally:
+            database_gate.release_shared()
+    return apply_batch
+
+@app.route("/products/enrich", methods=["GET", "POST", "DELETE"])
+def enrich_products():
+    """
+    Start a background enrichment job (POST), report its progress (GET) or cancel it (DELETE).
+    POST body (optional): {"overwrite": false, "limit": 100}
+    """
+    if request.method == "GET":
+        return jsonify({"status": "ok", "job": enrichment_job.progress()})
 
+    if request.method == "DELETE":
+        if not enrichment_job.cancel():
+            return jsonify({"status": "error", "message": "No enrichment job is running."}), 409
+        logger.info("Enrichment job cancellation requested.")
+        return jsonify({"status": "ok", "job": enrichment_job.progress()})
+
+    data = request.get_json(silent=True) or {}
+    overwrite = bool(data.get("overwrite", False))
+    limit = data.get("limit")
+    if limit is not None and (not isinstance(limit, int) or limit < 1):
+        logger.warning("Invalid limit in enrichment request: %s", limit)
+        return jsonify({"status": "error", "message": "limit must be a positive integer"}), 400
+
+    session = Session()
+    try:
+        items = products_missing_metadata(session, overwrite, limit)
+    except Exception as e:
+        logger.error("Error selecting products for enrichment: %s", e)
+        return jsonify({"status": "error", "message": "Failed to start enrichment"}), 500
+    finally:
+        Session.remove()
+
+    if not items:
+        return jsonify({"status": "ok", "message": "No products need enrichment.", "job": enrichment_job.progress()})
+
+    started = enrichment_job.start(
+        items,
+        lambda barcode, before_fetch: product_lookup_cache.lookup(barcode, before_fetch)[0],
+        make_enrichment_writer(database_gate.generation, overwrite),
+        concurrency=ENRICHMENT_CONCURRENCY,
+        rate=ENRICHMENT_RATE,
+        batch_size=ENRICHMENT_BATCH_SIZE
+    )
+    if not started:
+        return jsonify({"status": "error", "message": "An enrichment job is already running."}), 409
+    return jsonify({"status": "ok", "job": enrichment_job.progress()}), 202
+
+# ------------------------------------------------
+# Delete Database
+# ------------------------------------------------
 # Define the path for the lock file
 LOCK_FILE_PATH = os.path.join(DB_DIR, "delete_database.lock")
 
-# Initialize the file-based lock
-delete_lock = FileLock(LOCK_FILE_PATH, timeout=0)  # timeout=0 for non-blocking
-
 @app.route("/delete_database", methods=["DELETE"])
 def delete_database():
-    global engine, Session
-
     logger.debug("Received request to delete the database.")
+    from filelock import FileLock, Timeout  # Only needed here, so kept out of startup
 
+    # The file-based lock is created per request because lock objects must not be inherited by forked workers
+    delete_lock = FileLock(LOCK_FILE_PATH, timeout=0)  # timeout=0 for non-blocking
     try:
         # Attempt to acquire the file-based lock without blocking
         delete_lock.acquire(timeout=0)
@@ -783,33 +2314,26 @@ def delete_database():
 
             try:
                 # Create a backup before deletion
-                backup_dir = os.path.join(DB_DIR, "backups")
-                os.makedirs(backup_dir, exist_ok=True)
-                timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-                backup_file = os.path.join(backup_dir, f"pantry_data_backup_{timestamp}.db")
-                shutil.copy(DB_FILE, backup_file)
-                logger.info(f"Backup created at {backup_file}")
-
-                # Dispose the existing engine to release the database file
-                engine.dispose()
-                logger.debug("Engine disposed successfully.")
-
-                # Remove the database file
-                os.remove(DB_FILE)
-                logger.info("Database file deleted successfully.")
-
-                # Recreate the engine and session for a fresh database
-                engine = create_engine(
-                    f'sqlite:///{DB_FILE}',
-                    connect_args={'check_same_thread': False},
-                    echo=False
-                )
-                Base.metadata.create_all(engine)
-                logger.info("Database schema created successfully after deletion.")
-
-                # Reconfigure Session
-                SessionFactory = sessionmaker(bind=engine)
-                Session = scoped_session(SessionFactory)
+                backup = backup_manager.create_snapshot()
+                logger.info(f"Backup created: {backup['name']}")
+
+                # Replace the contents with a freshly migrated, empty database
+                empty_db_path = os.path.join(DB_DIR, "empty_temp.db")
+                if os.path.exists(empty_db_path):
+                    os.remove(empty_db_path)
+                migrate_database(empty_db_path)
+                match_page_size(empty_db_path, read_page_size(DB_FILE))
+                try:
+                    with database_gate.exclusive(DATABASE_DRAIN_TIMEOUT):
+                        restore_database(engine, empty_db_path)
+                        invalidate_swapped_data()
+                finally:
+                    os.remove(empty_db_path)
+                logger.info("Database contents deleted successfully.")
+
+                # Drop the connections opened before the swap and tell clients to resync
+                refresh_engine_pool()
+                record_database_reset()
                 logger.info("Database session reinitialized after deletion.")
 
                 return jsonify({
@@ -817,6 +2341,12 @@ def delete_database():
                     "message": "Database deleted and reinitialized."
                 }), 200
 
+            except DatabaseBusy as e:
+                logger.warning(f"Database deletion rejected: {e}")
+                return jsonify({
+                    "status": "error",
+                    "message": "The database is busy. Try again shortly."
+                }), 503
             except Exception as e:
                 logger.exception(f"Error during database deletion and reinitialization: {e}")
                 return jsonify({
@@ -843,9 +2373,8 @@ def delete_database():
 def get_theme():
     """Return the current theme from config.ini"""
     try:
-        # Reload config from disk to catch any manual changes
-        config.read(CONFIG_FILE)
-        current_theme = config['Settings'].get('theme', 'light')
+        # Cached, but picks up manual changes to config.ini within a few seconds
+        current_theme = settings.get('Settings', 'theme', fallback='light')
         logger.debug(f"Current theme retrieved: {current_theme}")
         return jsonify({"theme": current_theme})
     except Exception as e:
@@ -865,10 +2394,11 @@ def set_theme():
 
     # Update the theme in the config and write to disk
     try:
-        config.read(CONFIG_FILE)  # Ensure we're reading the latest config
-        config['Settings']['theme'] = new_theme
-        with open(CONFIG_FILE, 'w') as f:
-            config.write(f)
+        def apply(parser):
+            add_missing_settings(parser)
+            parser['Settings']['theme'] = new_theme
+
+        settings.update(apply)
         logger.info(f"Theme updated to: {new_theme}")
         # Return a success response with the new theme
         return jsonify({"status": "ok", "theme": new_theme})
@@ -888,8 +2418,8 @@ def get_api_key():
     Ensure this route is protected and only accessible from the frontend.
     """
     try:
-        # Retrieve the API key from config
-        api_key = config['Settings'].get('api_key', '')
+        # Retrieve the API key from the cached settings
+        api_key = settings.get('Settings', 'api_key', fallback='')
         if not api_key:
             logger.error("API key not found in config.ini.")
             return jsonify({"status": "error", "message": "API key not configured."}), 500
@@ -916,12 +2446,12 @@ def regenerate_api_key():
         new_api_key = generate_api_key()
         logger.debug("Generated a new API key for regeneration.")
 
-        # Update the config object
-        config['Settings']['api_key'] = new_api_key
+        # Write the updated config back to the file; every worker sees the new key on its next request
+        def apply(parser):
+            add_missing_settings(parser)
+            parser['Settings']['api_key'] = new_api_key
 
-        # Write the updated config back to the file
-        with open(CONFIG_FILE, 'w') as f:
-            config.write(f)
+        settings.update(apply)
         logger.info("API key regenerated and updated in config.ini.")
 
         # Return the new API key as JSON
@@ -947,14 +2477,13 @@ def save_column_visibility():
             return jsonify({"status": "error", "message": "No settings provided"}), 400
 
         # Save settings in config.ini
-        if "ColumnVisibility" not in config:
-            config.add_section("ColumnVisibility")
-
-        for column, visible in column_settings.items():
-            config.set("ColumnVisibility", column, str(visible).lower())
+        def apply(parser):
+            if "ColumnVisibility" not in parser:
+                parser.add_section("ColumnVisibility")
+            for column, visible in column_settings.items():
+                parser.set("ColumnVisibility", column, str(visible).lower())
 
-        with open(CONFIG_FILE, "w") as f:
-            config.write(f)
+        settings.update(apply)
 
         return jsonify({"status": "ok", "message": "Column visibility settings saved successfully."}), 200
     except Exception as e:
@@ -968,14 +2497,15 @@ def get_column_visibility():
     Retrieve column visibility settings from the config.ini file.
     """
     try:
-        if "ColumnVisibility" in config:
-            settings = {
-                key: config.getboolean("ColumnVisibility", key)
-                for key in config["ColumnVisibility"]
+        current = settings.read()
+        if "ColumnVisibility" in current:
+            visibility = {
+                key: current.getboolean("ColumnVisibility", key)
+                for key in current["ColumnVisibility"]
             }
         else:
             # Default visibility settings if none exist
-            settings = {
+            visibility = {
                 "name": True,
                 "category": True,
                 "image": True,
@@ -983,17 +2513,88 @@ def get_column_visibility():
                 "actions": True,
             }
 
-        return jsonify({"status": "ok", "settings": settings}), 200
+        return jsonify({"status": "ok", "settings": visibility}), 200
     except Exception as e:
         logger.error(f"Error retrieving column visibility settings: {e}")
         return jsonify({"status": "error", "message": "Failed to retrieve settings."}), 500
 
 
+# -----------------------------
+# Metrics
+# -----------------------------
+def worker_stat_metrics(prefix, description, stats, counters=(), gauges=()):
+    """Format entries of a stats() dict as metrics labelled with the pid of this worker."""
+    labels = {"worker": os.getpid()}
+    text = ""
+    for key in counters:
+        text += format_metric(
+            f"{prefix}_{key}_total", "counter", f"{description}: {key.replace('_', ' ')}.", [(labels, stats[key])]
+        )
+    for key in gauges:
+        text += format_metric(
+            f"{prefix}_{key}", "gauge", f"{description}: {key.replace('_', ' ')}.", [(labels, stats[key])]
+        )
+    return text
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Metrics in the Prometheus text format.
+    Request and SQL metrics are totals for every worker process. Cache and OpenFoodFacts
+    statistics are kept per process and carry the pid of the worker that answered.
+    """
+    try:
+        text = request_metrics.render()
+
+        file_sizes = []
+        for name, path in (("database", DB_FILE), ("wal", DB_FILE + "-wal")):
+            if os.path.exists(path):
+                file_sizes.append(({"file": name}, os.path.getsize(path)))
+        text += format_metric("pantry_database_size_bytes", "gauge", "Size of the SQLite database files.", file_sizes)
+        text += format_metric("pantry_data_version", "gauge", "Version of the data, bumped by every write.", [({}, get_data_version())])
+        text += format_metric(
+            "pantry_event_subscribers", "gauge", "Connected event streams and long polls in this worker.",
+            [({"worker": os.getpid()}, event_broker.subscriber_count)]
+        )
+
+        text += worker_stat_metrics(
+            "pantry_response_cache", "Response cache", response_cache.stats(),
+            counters=("hits", "misses", "stale", "evictions"), gauges=("entries",)
+        )
+        text += worker_stat_metrics(
+            "pantry_openfoodfacts_cache", "OpenFoodFacts lookup cache", product_lookup_cache.stats(),
+            counters=("hits", "negative_hits", "misses", "coalesced", "stale", "errors"), gauges=("entries",)
+        )
+        upstream = openfoodfacts_client.stats()
+        upstream["circuit_open"] = int(upstream["state"] != "closed")
+        text += worker_stat_metrics(
+            "pantry_openfoodfacts", "OpenFoodFacts API", upstream,
+            counters=("requests", "retries", "failures", "short_circuited"), gauges=("circuit_open",)
+        )
+        text += worker_stat_metrics(
+            "pantry_auth", "API key authentication", api_key_auth.stats(),
+            counters=("rejected", "limited"), gauges=("keys", "rate_limited_keys")
+        )
+        text += worker_stat_metrics(
+            "pantry_thumbnails", "Product image thumbnails", thumbnail_cache.stats(),
+            counters=("hits", "downloads", "failures", "evictions"), gauges=("entries", "bytes")
+        )
+        return Response(text, content_type="text/plain; version=0.0.4; charset=utf-8")
+    except Exception as e:
+        logger.error(f"Error collecting metrics: {e}")
+        return jsonify({"status": "error", "message": "Failed to collect metrics."}), 500
+
+# Every route is registered by now, so each endpoint gets its own slots in shared memory
+request_metrics = RequestMetrics(app.view_functions)
+
+mark_startup_phase("services")
+log_startup_report()
 
 # -----------------------------
 # Run the Application
 # -----------------------------
 
 if __name__ == "__main__":
-    # Do not run app.run() since Gunicorn handles it
-    app.run(host="0.0.0.0", port=8099)
\ No newline at end of file
+    # Development server only. The add-on runs the app under Gunicorn (see gunicorn.conf.py)
+    backup_manager.start_scheduler()
+    app.run(host="0.0.0.0", port=8099, threaded=True)
\ No newline at end of file
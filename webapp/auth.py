@@ -0,0 +1,168 @@
+# pantry_tracker/webapp/auth.py
+
+import hmac
+import mmap
+import time
+import struct
+import logging
+import threading
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KEY_NAME = "default"  # The key in [Settings] api_key, used by the web UI
+KEY_SECTION_PREFIX = "ApiKey."  # Named keys are configured in [ApiKey.<name>] sections
+RATE_WINDOW_SECONDS = 60  # rate_limit is the number of requests allowed per window
+MAX_RATE_LIMITED_KEYS = 64
+WINDOW_FORMAT = "II"  # Window number and the requests counted in it
+WINDOW_SIZE = struct.calcsize(WINDOW_FORMAT)
+
+
+class InvalidApiKey(Exception):
+    """Raised when a request presents a key that matches no configured API key."""
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a key has used up its requests for the current window."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Rate limit exceeded for API key '{name}'.")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class ApiKey:
+    def __init__(self, name, secret, rate_limit=0, slot=None):
+        self.name = name
+        self.secret = secret.encode("utf-8")
+        self.rate_limit = rate_limit
+        self.slot = slot
+
+
+def load_api_keys(parser, max_rate_limited=MAX_RATE_LIMITED_KEYS):
+    """
+    Return the API keys configured in parser: the default key from [Settings] and one
+    key per [ApiKey.<name>] section with options `key` and `rate_limit` (requests per
+    RATE_WINDOW_SECONDS, 0 for no limit). Rate limited keys get a counter slot by name
+    order, so every worker assigns the same slots.
+    """
+    keys = []
+    secrets_seen = set()
+    default_secret = parser.get("Settings", "api_key", fallback="").strip()
+    if default_secret:
+        keys.append(ApiKey(DEFAULT_KEY_NAME, default_secret))
+        secrets_seen.add(default_secret)
+
+    slot = 0
+    for section in sorted(parser.sections()):
+        if not section.startswith(KEY_SECTION_PREFIX):
+            continue
+        name = section[len(KEY_SECTION_PREFIX):]
+        secret = parser.get(section, "key", fallback="").strip()
+        if not name or not secret:
+            logger.warning(f"Ignoring API key section [{section}] without a name or key.")
+            continue
+        if secret in secrets_seen:
+            logger.warning(f"Ignoring API key '{name}': the same key is already configured.")
+            continue
+        try:
+            rate_limit = max(parser.getint(section, "rate_limit", fallback=0), 0)
+        except ValueError:
+            logger.warning(f"Invalid rate_limit for API key '{name}'. The key is not limited.")
+            rate_limit = 0
+        key = ApiKey(name, secret, rate_limit)
+        if rate_limit:
+            if slot < max_rate_limited:
+                key.slot = slot
+                slot += 1
+            else:
+                logger.warning(f"More than {max_rate_limited} rate limited API keys. '{name}' is not limited.")
+                key.rate_limit = 0
+        keys.append(key)
+        secrets_seen.add(secret)
+    return keys
+
+
+class SharedRateLimits:
+    """
+    Fixed-window request counters in anonymous shared memory, one slot per rate limited
+    key, so a limit applies to the whole server rather than to each worker.
+    """
+
+    def __init__(self, slots=MAX_RATE_LIMITED_KEYS, window=RATE_WINDOW_SECONDS):
+        self.slots = slots
+        self.window = window
+        self._map = mmap.mmap(-1, slots * WINDOW_SIZE)
+        self._lock = multiprocessing.Lock()
+
+    def hit(self, slot, limit):
+        """Count a request in slot. Returns 0 if it is allowed, else the seconds until the next window."""
+        now = time.time()
+        current = int(now // self.window)
+        offset = slot * WINDOW_SIZE
+        with self._lock:
+            window, count = struct.unpack_from(WINDOW_FORMAT, self._map, offset)
+            if window != current:
+                window, count = current, 0
+            if count >= limit:
+                return max(int((current + 1) * self.window - now) + 1, 1)
+            struct.pack_into(WINDOW_FORMAT, self._map, offset, window, count + 1)
+            return 0
+
+
+class ApiKeyAuth:
+    """
+    Checks presented keys against the configured API keys. The key table is rebuilt only
+    when the settings store hands out a new parser, so a request costs one constant-time
+    comparison per configured key.
+    """
+
+    def __init__(self, settings, limits=None):
+        self.settings = settings
+        self.limits = limits or SharedRateLimits()
+        self.rejected = 0
+        self.limited = 0
+        self._parser = None
+        self._keys = []
+        self._lock = threading.Lock()
+
+    def keys(self):
+        parser = self.settings.read()
+        if parser is not self._parser:
+            with self._lock:
+                if parser is not self._parser:
+                    self._keys = load_api_keys(parser, self.limits.slots)
+                    self._parser = parser
+        return self._keys
+
+    def authenticate(self, presented):
+        """
+        Return the name of the key matching presented.
+        Raises InvalidApiKey or RateLimitExceeded.
+        """
+        presented = presented.encode("utf-8")
+        match = None
+        # Compare against every key so the time taken does not reveal which one matched
+        for key in self.keys():
+            if hmac.compare_digest(key.secret, presented) and match is None:
+                match = key
+        if match is None:
+            with self._lock:
+                self.rejected += 1
+            raise InvalidApiKey("Invalid API key.")
+        if match.rate_limit:
+            retry_after = self.limits.hit(match.slot, match.rate_limit)
+            if retry_after:
+                with self._lock:
+                    self.limited += 1
+                raise RateLimitExceeded(match.name, retry_after)
+        return match.name
+
+    def stats(self):
+        keys = self.keys()
+        return {
+            "keys": len(keys),
+            "rate_limited_keys": sum(1 for key in keys if key.rate_limit),
+            "rejected": self.rejected,
+            "limited": self.limited,
+        }
@@ -0,0 +1,192 @@
+# pantry_tracker/webapp/backups.py
+
+import os
+import re
+import gzip
+import time
+import fcntl
+import shutil
+import sqlite3
+import logging
+import datetime
+import threading
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PREFIX = "pantry_snapshot_"
+SNAPSHOT_PATTERN = re.compile(r"^pantry_snapshot_\d{14}(?:_\d+)?\.db(?:\.gz)?$")
+# Safety copies written by /delete_database in earlier versions. They are listed and can be
+# downloaded, but retention never removes them.
+LEGACY_BACKUP_PATTERN = re.compile(r"^pantry_data_backup_\d{14}\.db$")
+SCHEDULER_POLL_INTERVAL = 60  # Seconds between checks whether a scheduled snapshot is due
+COMPRESS_CHUNK_SIZE = 1024 * 1024
+
+
+def snapshot_database(db_file, target_file):
+    """
+    Write a consistent, compacted copy of db_file to target_file with VACUUM INTO.
+    The copy is read from a single snapshot, and in WAL mode that read never blocks writers,
+    so this can run while the API keeps serving requests.
+    """
+    conn = sqlite3.connect(db_file, timeout=30)
+    try:
+        conn.execute("VACUUM INTO ?", (target_file,))
+    finally:
+        conn.close()
+
+
+def compress_file(path):
+    """Gzip a file in chunks, remove the original and return the new path."""
+    compressed_path = path + ".gz"
+    with open(path, "rb") as source, gzip.open(compressed_path, "wb") as target:
+        shutil.copyfileobj(source, target, COMPRESS_CHUNK_SIZE)
+    os.remove(path)
+    return compressed_path
+
+
+class BackupManager:
+    """
+    Snapshots of the database in the backups directory, with retention by count and age.
+    Retention only applies to snapshots taken by this class; legacy backups are kept.
+    Scheduled snapshots are taken by a background thread. When several worker processes
+    run one, only the process holding the scheduler lock takes snapshots.
+    """
+
+    def __init__(self, db_file, backup_dir, interval_hours=24, retain_count=7, retain_days=30, compress=False):
+        self.db_file = db_file
+        self.backup_dir = backup_dir
+        self.interval_hours = interval_hours
+        self.retain_count = retain_count
+        self.retain_days = retain_days
+        self.compress = compress
+        self._lock = threading.Lock()
+        self._scheduler = None
+        self._leader_fd = None
+
+    def settings(self):
+        return {
+            "schedule_hours": self.interval_hours,
+            "retain_count": self.retain_count,
+            "retain_days": self.retain_days,
+            "compress": self.compress,
+        }
+
+    def _new_snapshot_path(self):
+        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        path = os.path.join(self.backup_dir, f"{SNAPSHOT_PREFIX}{timestamp}.db")
+        suffix = 1
+        while os.path.exists(path) or os.path.exists(path + ".gz"):
+            path = os.path.join(self.backup_dir, f"{SNAPSHOT_PREFIX}{timestamp}_{suffix}.db")
+            suffix += 1
+        return path
+
+    def create_snapshot(self, compress=None):
+        """Take a snapshot now, apply retention and return its description."""
+        compress = self.compress if compress is None else compress
+        os.makedirs(self.backup_dir, exist_ok=True)
+        with self._lock:
+            path = self._new_snapshot_path()
+            # Write under a temporary name so a partial snapshot is never listed or served
+            temp_path = path + ".tmp"
+            started = time.monotonic()
+            try:
+                snapshot_database(self.db_file, temp_path)
+                os.replace(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            if compress:
+                path = compress_file(path)
+            logger.info(f"Snapshot created at {path} in {time.monotonic() - started:.2f}s")
+            self.prune()
+        return self.describe(os.path.basename(path))
+
+    def describe(self, name):
+        stat = os.stat(os.path.join(self.backup_dir, name))
+        return {
+            "name": name,
+            "size": stat.st_size,
+            "compressed": name.endswith(".gz"),
+            "legacy": bool(LEGACY_BACKUP_PATTERN.match(name)),
+            "created_at": datetime.datetime.fromtimestamp(stat.st_mtime).isoformat(),
+        }
+
+    @staticmethod
+    def _is_backup(name):
+        return bool(SNAPSHOT_PATTERN.match(name) or LEGACY_BACKUP_PATTERN.match(name))
+
+    def list_snapshots(self, include_legacy=True):
+        """Return every snapshot, newest first, with legacy backups unless include_legacy is False."""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        matches = self._is_backup if include_legacy else SNAPSHOT_PATTERN.match
+        names = [name for name in os.listdir(self.backup_dir) if matches(name)]
+        snapshots = [self.describe(name) for name in names]
+        snapshots.sort(key=lambda snapshot: snapshot["created_at"], reverse=True)
+        return snapshots
+
+    def snapshot_path(self, name):
+        """Return the path of a snapshot by name, or None if it does not exist or is not a snapshot."""
+        if not self._is_backup(name):
+            return None
+        path = os.path.join(self.backup_dir, name)
+        return path if os.path.isfile(path) else None
+
+    def prune(self):
+        """
+        Remove snapshots beyond the retention count or older than the retention age.
+        The newest snapshot is always kept, and legacy backups are neither counted nor removed.
+        """
+        cutoff = None
+        if self.retain_days > 0:
+            cutoff = (datetime.datetime.now() - datetime.timedelta(days=self.retain_days)).isoformat()
+        removed = []
+        for index, snapshot in enumerate(self.list_snapshots(include_legacy=False)):
+            if index == 0:
+                continue
+            too_many = self.retain_count > 0 and index >= self.retain_count
+            too_old = cutoff is not None and snapshot["created_at"] < cutoff
+            if too_many or too_old:
+                os.remove(os.path.join(self.backup_dir, snapshot["name"]))
+                removed.append(snapshot["name"])
+        if removed:
+            logger.info(f"Removed {len(removed)} old snapshots: {', '.join(removed)}")
+        return removed
+
+    def snapshot_due(self):
+        snapshots = self.list_snapshots(include_legacy=False)
+        if not snapshots:
+            return True
+        latest = datetime.datetime.fromisoformat(snapshots[0]["created_at"])
+        return datetime.datetime.now() - latest >= datetime.timedelta(hours=self.interval_hours)
+
+    def start_scheduler(self):
+        """Start the scheduled snapshot thread for this process, unless scheduling is disabled."""
+        if self.interval_hours <= 0 or (self._scheduler is not None and self._scheduler.is_alive()):
+            return
+        self._scheduler = threading.Thread(target=self._run_scheduler, name="backup-scheduler", daemon=True)
+        self._scheduler.start()
+        logger.debug(f"Backup scheduler started (every {self.interval_hours}h).")
+
+    def _try_lead(self):
+        os.makedirs(self.backup_dir, exist_ok=True)
+        fd = os.open(os.path.join(self.backup_dir, ".scheduler.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        # Held for the lifetime of the process; another worker takes over if this one exits
+        self._leader_fd = fd
+        logger.info(f"Process {os.getpid()} is taking scheduled snapshots.")
+        return True
+
+    def _run_scheduler(self):
+        while True:
+            try:
+                if self._leader_fd is not None or self._try_lead():
+                    if self.snapshot_due():
+                        self.create_snapshot()
+            except Exception as e:
+                logger.error(f"Scheduled snapshot failed: {e}")
+            time.sleep(SCHEDULER_POLL_INTERVAL)
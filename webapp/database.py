@@ -0,0 +1,247 @@
+# pantry_tracker/webapp/database.py
+
+import os
+import re
+import time
+import fcntl
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from versioning import SharedCounters
+
+logger = logging.getLogger(__name__)
+
+# SQLite settings applied to every new connection. Each one can be overridden in the
+# [Database] section of config.ini, e.g. "synchronous = FULL".
+DEFAULT_SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",      # Readers no longer block the writer
+    "synchronous": "NORMAL",    # Safe with WAL, avoids an fsync on every commit
+    "busy_timeout": "5000",     # Milliseconds to wait for a lock before failing
+    "cache_size": "-8000",      # Negative values are KiB (8 MB page cache)
+    "mmap_size": "67108864",    # 64 MB memory-mapped I/O
+    "temp_store": "MEMORY",
+}
+
+# Pragma values are interpolated into SQL, so only plain words and numbers are accepted
+PRAGMA_VALUE_PATTERN = re.compile(r"^-?[A-Za-z0-9_]+$")
+
+
+def load_sqlite_pragmas(config):
+    """Merge the [Database] section of config.ini over the default SQLite settings."""
+    pragmas = dict(DEFAULT_SQLITE_PRAGMAS)
+    if config.has_section('Database'):
+        for name, value in config['Database'].items():
+            if name not in DEFAULT_SQLITE_PRAGMAS:
+                continue
+            value = value.strip()
+            if not PRAGMA_VALUE_PATTERN.match(value):
+                logger.warning(f"Ignoring invalid value '{value}' for SQLite setting '{name}'.")
+                continue
+            pragmas[name] = value
+    return pragmas
+
+
+def create_db_engine(db_file, pragmas):
+    """Create an engine for the SQLite database that applies the given pragmas on every new connection."""
+    engine = create_engine(f'sqlite:///{db_file}', connect_args={'check_same_thread': False}, echo=False)
+
+    @event.listens_for(engine, "connect")
+    def apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value};")
+        finally:
+            cursor.close()
+
+    logger.debug(f"Created database engine for {db_file} with settings: {pragmas}")
+    return engine
+
+
+def read_sqlite_pragmas(engine, names):
+    """Read the active value of each pragma from a pooled connection."""
+    with engine.connect() as conn:
+        return {name: conn.exec_driver_sql(f"PRAGMA {name};").scalar() for name in names}
+
+
+class PageSizeMismatch(ValueError):
+    """Raised when a database cannot be restored because its page size differs from the live one."""
+
+
+def read_page_size(db_file):
+    conn = sqlite3.connect(db_file)
+    try:
+        return conn.execute("PRAGMA page_size;").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def match_page_size(db_file, page_size):
+    """
+    Rebuild db_file with the given page size if it uses a different one.
+    The backup API cannot change the page size of a WAL database, so a file must match the
+    live database before restore_database can copy it. Returns True if the file was rebuilt.
+    """
+    conn = sqlite3.connect(db_file)
+    try:
+        current = conn.execute("PRAGMA page_size;").fetchone()[0]
+        if current == page_size:
+            return False
+        # The page size of a WAL database is fixed, so switch to a rollback journal first
+        conn.execute("PRAGMA journal_mode = DELETE;")
+        conn.execute(f"PRAGMA page_size = {int(page_size)};")
+        conn.execute("VACUUM;")
+        logger.info(f"Rebuilt {db_file} with {page_size} byte pages (was {current}).")
+        return True
+    finally:
+        conn.close()
+
+
+def restore_database(engine, source_file):
+    """
+    Overwrite the live database with the contents of source_file using SQLite's backup API.
+    The file itself is never replaced, so connections held by other worker processes stay
+    valid and its WAL and shared-memory files remain consistent.
+    Raises PageSizeMismatch if source_file was not first converted with match_page_size.
+    """
+    source = sqlite3.connect(source_file)
+    target = engine.raw_connection()
+    try:
+        source_page_size = source.execute("PRAGMA page_size;").fetchone()[0]
+        target_page_size = target.driver_connection.execute("PRAGMA page_size;").fetchone()[0]
+        if source_page_size != target_page_size:
+            raise PageSizeMismatch(
+                f"The database uses {source_page_size} byte pages, the live database {target_page_size}."
+            )
+        source.backup(target.driver_connection)
+    finally:
+        target.close()
+        source.close()
+    logger.info(f"Restored database contents from {source_file}")
+
+
+class DatabaseBusy(Exception):
+    """Raised when the database gate cannot be entered before the timeout expires."""
+
+
+GATE_POLL_INTERVAL = 0.05  # Seconds between attempts to enter the gate
+
+
+class DatabaseGate:
+    """
+    Cross-process readers-writer gate around the database.
+    Requests hold a shared lock on the gate file while they use the database. Replacing
+    the database contents takes the exclusive lock, which waits for in-flight requests to
+    drain. The generation counter is odd while a swap is in progress, which holds new
+    requests back, and ends up even and higher afterwards, which tells every worker process
+    to rebuild its connection pool. If the swapping process dies, the next request finds
+    the swap lock free and reopens the gate. Must be created before worker processes are
+    forked.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._swap_path = path + ".swap"
+        self._counters = SharedCounters(["generation"])
+        self._local = threading.local()
+
+    @property
+    def generation(self):
+        return self._counters.get("generation")
+
+    def _thread_fd(self):
+        # flock() locks belong to an open file description, so every thread needs its own
+        fd = getattr(self._local, "fd", None)
+        if fd is None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._local.fd = fd
+            self._local.held = False
+        return fd
+
+    def acquire_shared(self, timeout):
+        """Enter the gate for the current thread, waiting up to timeout seconds for a swap to finish."""
+        fd = self._thread_fd()
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.generation % 2 == 0:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    pass
+                else:
+                    # A swap may have started between the check and the lock
+                    if self.generation % 2 == 0:
+                        self._local.held = True
+                        return
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+            elif self._recover_abandoned_swap():
+                continue
+            if time.monotonic() >= deadline:
+                raise DatabaseBusy("The database is being replaced.")
+            time.sleep(GATE_POLL_INTERVAL)
+
+    def _recover_abandoned_swap(self):
+        """
+        Close the gate again if the generation is odd but no process holds the swap lock,
+        which happens when a process died in the middle of a swap; the kernel released its
+        lock but nobody will ever end the swap. Returns True if the gate was reopened.
+        """
+        swap_fd = os.open(self._swap_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(swap_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            # The generation only changes under the swap lock, so this check cannot race a swap
+            if self.generation % 2 == 0:
+                return False
+            self._counters.increment("generation")
+            logger.warning("Reopened the database gate after a swap that never finished.")
+            return True
+        finally:
+            os.close(swap_fd)
+
+    def release_shared(self):
+        """Leave the gate if the current thread holds it."""
+        if getattr(self._local, "held", False):
+            fcntl.flock(self._local.fd, fcntl.LOCK_UN)
+            self._local.held = False
+
+    @contextmanager
+    def exclusive(self, timeout):
+        """
+        Hold the database exclusively while its contents are replaced.
+        New requests wait while in-flight ones drain for up to timeout seconds,
+        otherwise DatabaseBusy is raised and nothing is changed.
+        """
+        swap_fd = os.open(self._swap_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(swap_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise DatabaseBusy("Another database swap is in progress.")
+
+            self._counters.increment("generation")
+            fd = self._thread_fd()
+            held = self._local.held
+            try:
+                if held:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                deadline = time.monotonic() + timeout
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() >= deadline:
+                            raise DatabaseBusy("Timed out waiting for in-flight requests to finish.")
+                        time.sleep(GATE_POLL_INTERVAL)
+                logger.debug("Database gate held exclusively.")
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_SH if held else fcntl.LOCK_UN)
+                self._counters.increment("generation")
+        finally:
+            os.close(swap_fd)
@@ -0,0 +1,178 @@
+# pantry_tracker/webapp/enrichment.py
+
+import os
+import json
+import time
+import fcntl
+import logging
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 10  # Seconds between progress writes while a batch is being looked up
+STALE_SECONDS = 120  # A running job whose progress is older than this is treated as dead
+
+
+class RateLimiter:
+    """Space calls evenly so that no more than `rate` of them start per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class EnrichmentJob:
+    """
+    Background job that looks up metadata for a list of products and writes it back in batches.
+    Progress is kept in a JSON file and cancellation is requested with a marker file, so any
+    worker process can report on or cancel a job started by another. A lock file makes sure
+    only one job runs at a time. The progress file names the process running the job and is
+    rewritten at least every HEARTBEAT_INTERVAL seconds, so a job whose process died is not
+    reported as running forever.
+    """
+
+    def __init__(self, state_dir):
+        self.progress_file = os.path.join(state_dir, "enrichment_progress.json")
+        self.cancel_file = os.path.join(state_dir, "enrichment.cancel")
+        self.lock_file = os.path.join(state_dir, "enrichment.lock")
+
+    def progress(self):
+        try:
+            with open(self.progress_file) as f:
+                progress = json.load(f)
+        except (OSError, ValueError):
+            return {"state": "idle"}
+        if progress.get("state") == "running" and not self._owner_alive(progress):
+            progress["state"] = "failed"
+            progress["message"] = "The enrichment job stopped unexpectedly."
+        return progress
+
+    @staticmethod
+    def _owner_alive(progress):
+        heartbeat = progress.get("heartbeat")
+        if not isinstance(heartbeat, (int, float)) or time.time() - heartbeat > STALE_SECONDS:
+            return False
+        try:
+            os.kill(progress.get("pid"), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        except (TypeError, OSError):
+            return False
+        return True
+
+    def _write_progress(self, progress):
+        progress["updated_at"] = datetime.datetime.now().isoformat()
+        progress["heartbeat"] = time.time()
+        temp_path = self.progress_file + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(progress, f)
+        os.replace(temp_path, self.progress_file)
+
+    def cancel(self):
+        """Ask the running job to stop after its current batch. Returns False if no job is running."""
+        if self.progress().get("state") != "running":
+            return False
+        open(self.cancel_file, "w").close()
+        return True
+
+    def start(self, items, lookup, apply_batch, concurrency=4, rate=1.5, batch_size=50):
+        """
+        Start a job for items, a list of (product_id, barcode) pairs.
+        lookup(barcode, before_fetch) returns the product data or None and raises on failure;
+        before_fetch must be called before any upstream request so the rate limit applies.
+        apply_batch(results) writes a list of (product_id, data) pairs in one transaction and
+        returns the number of products it changed.
+        Returns False if a job is already running.
+        """
+        lock_fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(lock_fd)
+            return False
+
+        if os.path.exists(self.cancel_file):
+            os.remove(self.cancel_file)
+        progress = {
+            "state": "running",
+            "total": len(items),
+            "processed": 0,
+            "updated": 0,
+            "not_found": 0,
+            "failed": 0,
+            "started_at": datetime.datetime.now().isoformat(),
+            "finished_at": None,
+            "message": None,
+            "pid": os.getpid(),
+        }
+        self._write_progress(progress)
+        thread = threading.Thread(
+            target=self._run,
+            args=(lock_fd, progress, items, lookup, apply_batch, concurrency, RateLimiter(rate), batch_size),
+            name="enrichment-job",
+            daemon=True
+        )
+        thread.start()
+        logger.info(f"Enrichment job started for {len(items)} products.")
+        return True
+
+    def _run(self, lock_fd, progress, items, lookup, apply_batch, concurrency, limiter, batch_size):
+        def fetch(item):
+            product_id, barcode = item
+            try:
+                return product_id, lookup(barcode, limiter.wait), None
+            except Exception as e:
+                return product_id, None, e
+
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="enrichment") as pool:
+                for start in range(0, len(items), batch_size):
+                    if os.path.exists(self.cancel_file):
+                        progress["state"] = "cancelled"
+                        break
+
+                    found = []
+                    for product_id, data, error in pool.map(fetch, items[start:start + batch_size]):
+                        if time.time() - progress["heartbeat"] >= HEARTBEAT_INTERVAL:
+                            self._write_progress(progress)
+                        if error is not None:
+                            progress["failed"] += 1
+                            logger.warning(f"Enrichment lookup failed for product {product_id}: {error}")
+                        elif data is None:
+                            progress["not_found"] += 1
+                        else:
+                            found.append((product_id, data))
+                    if found:
+                        progress["updated"] += apply_batch(found)
+                    progress["processed"] += len(items[start:start + batch_size])
+                    self._write_progress(progress)
+                else:
+                    progress["state"] = "completed"
+        except Exception as e:
+            logger.exception(f"Enrichment job failed: {e}")
+            progress["state"] = "failed"
+            progress["message"] = str(e)
+        finally:
+            progress["finished_at"] = datetime.datetime.now().isoformat()
+            self._write_progress(progress)
+            if os.path.exists(self.cancel_file):
+                os.remove(self.cancel_file)
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+            logger.info(
+                f"Enrichment job {progress['state']}: {progress['updated']} updated, "
+                f"{progress['not_found']} not found, {progress['failed']} failed."
+            )
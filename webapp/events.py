@@ -0,0 +1,117 @@
+# pantry_tracker/webapp/events.py
+
+import json
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriberLimitReached(Exception):
+    """Raised when the maximum number of concurrent subscribers is already connected."""
+
+
+class Subscriber:
+    """
+    A connected client with a bounded queue of pending events.
+    When the queue overflows, pending events are dropped and replaced with a
+    single resync event, so a slow client never blocks the publishers.
+    """
+
+    def __init__(self, queue_size):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def put(self, event):
+        with self._lock:
+            try:
+                self.queue.put_nowait(event)
+            except queue.Full:
+                self.dropped += 1
+                while True:
+                    try:
+                        self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                self.queue.put_nowait(("resync", None, {"reason": "overflow"}))
+                logger.warning("Subscriber queue overflowed. Dropped pending events and requested a resync.")
+
+
+def format_sse(event_type, data, event_id=None):
+    """Format a single Server-Sent Events message."""
+    message = ""
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    message += f"event: {event_type}\n"
+    message += f"data: {json.dumps(data)}\n\n"
+    return message
+
+
+class EventBroker:
+    """Fan out change events to Server-Sent Events streams and long-poll waiters."""
+
+    def __init__(self, max_subscribers=10, queue_size=100):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._condition = threading.Condition()
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        """Register a new subscriber or raise SubscriberLimitReached."""
+        with self._condition:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise SubscriberLimitReached()
+            subscriber = Subscriber(self.queue_size)
+            self._subscribers.add(subscriber)
+        logger.debug(f"Subscriber connected ({len(self._subscribers)}/{self.max_subscribers}).")
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._condition:
+            self._subscribers.discard(subscriber)
+        logger.debug(f"Subscriber disconnected ({len(self._subscribers)}/{self.max_subscribers}).")
+
+    def publish(self, event_type, data, event_id=None):
+        """Queue an event for every subscriber and wake up long-poll waiters."""
+        with self._condition:
+            subscribers = list(self._subscribers)
+            self._condition.notify_all()
+        for subscriber in subscribers:
+            subscriber.put((event_type, event_id, data))
+
+    def notify(self):
+        """Wake up long-poll waiters so they re-check their predicate."""
+        with self._condition:
+            self._condition.notify_all()
+
+    def wait_for(self, predicate, timeout):
+        """
+        Block until predicate() is true or the timeout expires.
+        The predicate is re-checked every time an event is published.
+        """
+        with self._condition:
+            return self._condition.wait_for(predicate, timeout)
+
+    def stream(self, subscriber, heartbeat_interval):
+        """
+        Generate Server-Sent Events for a subscriber until the client disconnects.
+        A comment line is sent when idle so proxies keep the connection open and
+        dead clients are detected on the next write.
+        """
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event_type, event_id, data = subscriber.queue.get(timeout=heartbeat_interval)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield format_sse(event_type, data, event_id)
+        finally:
+            self.unsubscribe(subscriber)
@@ -0,0 +1,57 @@
+# pantry_tracker/webapp/gunicorn.conf.py
+#
+# Production server settings. Worker counts and timeouts come from the add-on options
+# (/data/options.json) and can be overridden with PANTRY_* environment variables.
+
+import os
+import json
+import logging
+
+logger = logging.getLogger("gunicorn.error")
+
+OPTIONS_FILE = "/data/options.json"
+
+
+def load_addon_options():
+    try:
+        with open(OPTIONS_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+options = load_addon_options()
+
+
+def setting(name, default):
+    return int(os.environ.get(f"PANTRY_{name.upper()}", options.get(name, default)))
+
+
+bind = "0.0.0.0:8099"
+
+# Threaded workers: SQLite reads run concurrently in WAL mode, and Server-Sent Events
+# streams hold a thread each, so keep threads above the event subscriber limit (10).
+worker_class = "gthread"
+workers = setting("workers", 2)
+threads = setting("threads", 16)
+
+timeout = setting("timeout", 60)  # Seconds before an unresponsive worker is restarted
+graceful_timeout = setting("graceful_timeout", 30)  # Seconds workers get to finish requests on reload/shutdown
+keepalive = setting("keepalive", 5)  # Seconds an idle keep-alive connection is held open
+
+# Load the app once in the master process. The data version counters and ETag epoch
+# live in shared memory created at import time and must be inherited by every worker.
+preload_app = True
+
+accesslog = None
+errorlog = "-"
+loglevel = "info"
+
+
+def post_fork(server, worker):
+    # Connections opened by the master (e.g. during migrations) must not be shared with workers
+    import app
+    app.engine.dispose(close=False)
+    # Every worker runs the scheduler; only the one holding the scheduler lock takes snapshots
+    app.backup_manager.start_scheduler()
+    logger.info("Worker %s started (%d threads).", worker.pid, threads)
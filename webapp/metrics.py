@@ -0,0 +1,175 @@
+# pantry_tracker/webapp/metrics.py
+
+import mmap
+import time
+import struct
+import logging
+import multiprocessing
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the request latency histogram buckets (long polls last up to 30s)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+VALUE_FORMAT = "d"  # Durations are fractional, so every value is a double
+VALUE_SIZE = struct.calcsize(VALUE_FORMAT)
+
+
+class SharedMetrics:
+    """
+    Fixed set of float counters in anonymous shared memory, like SharedCounters in
+    versioning.py. Worker processes forked after creation add to the same values, so a
+    scrape of any worker reports totals for the whole server.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._map = mmap.mmap(-1, size * VALUE_SIZE)
+        self._lock = multiprocessing.Lock()
+
+    def add(self, amounts):
+        """Add each (index, amount) pair under a single lock acquisition."""
+        with self._lock:
+            for index, amount in amounts:
+                offset = index * VALUE_SIZE
+                value = struct.unpack_from(VALUE_FORMAT, self._map, offset)[0]
+                struct.pack_into(VALUE_FORMAT, self._map, offset, value + amount)
+
+    def snapshot(self):
+        with self._lock:
+            return struct.unpack_from(f"{self.size}{VALUE_FORMAT}", self._map, 0)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def format_samples(name, samples):
+    return "".join(f"{name}{format_labels(labels)} {value!r}\n" for labels, value in samples)
+
+
+def format_metric(name, kind, help_text, samples):
+    """Format one metric family in the Prometheus text format. samples is a list of (labels, value)."""
+    return f"# HELP {name} {help_text}\n# TYPE {name} {kind}\n" + format_samples(name, samples)
+
+
+class RequestMetrics:
+    """
+    Per-endpoint request counts by status class, a latency histogram, and the number and
+    duration of SQL queries run while handling requests. Queries run outside a request
+    (background jobs) are recorded under the endpoint "background".
+    """
+
+    FIELDS = STATUS_CLASSES + tuple(f"le_{bound}" for bound in LATENCY_BUCKETS) + (
+        "duration_sum", "duration_count", "queries", "query_seconds"
+    )
+
+    def __init__(self, endpoints, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.endpoints = sorted(set(endpoints)) + ["unmatched", "background"]
+        self._endpoint_index = {endpoint: index for index, endpoint in enumerate(self.endpoints)}
+        self._field_index = {field: index for index, field in enumerate(self.FIELDS)}
+        self._values = SharedMetrics(len(self.endpoints) * len(self.FIELDS))
+
+    def _index(self, endpoint, field):
+        row = self._endpoint_index.get(endpoint, self._endpoint_index["unmatched"])
+        return row * len(self.FIELDS) + self._field_index[field]
+
+    def observe_request(self, endpoint, status, duration, queries=0, query_seconds=0.0):
+        status_class = f"{min(max(status // 100, 1), 5)}xx"
+        amounts = [
+            (self._index(endpoint, status_class), 1),
+            (self._index(endpoint, "duration_sum"), duration),
+            (self._index(endpoint, "duration_count"), 1),
+        ]
+        for bound in self.buckets:
+            if duration <= bound:
+                amounts.append((self._index(endpoint, f"le_{bound}"), 1))
+                break
+        if queries:
+            amounts.append((self._index(endpoint, "queries"), queries))
+            amounts.append((self._index(endpoint, "query_seconds"), query_seconds))
+        self._values.add(amounts)
+
+    def observe_queries(self, endpoint, queries, query_seconds):
+        self._values.add([
+            (self._index(endpoint, "queries"), queries),
+            (self._index(endpoint, "query_seconds"), query_seconds),
+        ])
+
+    def render(self):
+        """Return every request and query metric in the Prometheus text format."""
+        values = self._values.snapshot()
+
+        def value(endpoint, field):
+            return values[self._index(endpoint, field)]
+
+        requests, errors, buckets, sums, counts, queries, query_seconds = [], [], [], [], [], [], []
+        for endpoint in self.endpoints:
+            labels = {"endpoint": endpoint}
+            if value(endpoint, "queries"):
+                queries.append((labels, int(value(endpoint, "queries"))))
+                query_seconds.append((labels, value(endpoint, "query_seconds")))
+            count = int(value(endpoint, "duration_count"))
+            if not count:
+                continue
+            for status_class in STATUS_CLASSES:
+                if value(endpoint, status_class):
+                    requests.append(({"endpoint": endpoint, "status": status_class}, int(value(endpoint, status_class))))
+            errors.append((labels, int(value(endpoint, "5xx"))))
+            cumulative = 0
+            for bound in self.buckets:
+                cumulative += int(value(endpoint, f"le_{bound}"))
+                buckets.append(({"endpoint": endpoint, "le": f"{bound:g}"}, cumulative))
+            buckets.append(({"endpoint": endpoint, "le": "+Inf"}, count))
+            sums.append((labels, value(endpoint, "duration_sum")))
+            counts.append((labels, count))
+
+        lines = [format_metric(
+            "pantry_http_requests_total", "counter",
+            "Requests handled, by endpoint and status class.", requests
+        ), format_metric(
+            "pantry_http_request_errors_total", "counter",
+            "Requests answered with a 5xx status.", errors
+        )]
+        histogram = "pantry_http_request_duration_seconds"
+        lines.append(
+            f"# HELP {histogram} Time spent handling requests, excluding streamed response bodies.\n"
+            f"# TYPE {histogram} histogram\n"
+            + format_samples(f"{histogram}_bucket", buckets)
+            + format_samples(f"{histogram}_sum", sums)
+            + format_samples(f"{histogram}_count", counts)
+        )
+        lines.append(format_metric(
+            "pantry_db_queries_total", "counter", "SQL statements executed, by endpoint.", queries
+        ))
+        lines.append(format_metric(
+            "pantry_db_query_duration_seconds_total", "counter",
+            "Time spent executing SQL statements, by endpoint.", query_seconds
+        ))
+        return "".join(lines)
+
+
+def instrument_engine(engine, on_query):
+    """Call on_query(duration) after every SQL statement executed through engine."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+        on_query(time.perf_counter() - conn.info["query_started"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def stop_failed_query_timer(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            on_query(time.perf_counter() - conn.info["query_started"].pop())
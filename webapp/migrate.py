@@ -1,7 +1,6 @@
 import os
-import sqlite3
 from sqlalchemy import create_engine
-from models import Base
+from models import Base, OpenFoodFactsCache
 import logging
 
 # Configure logging
@@ -11,90 +10,160 @@ logger = logging.getLogger(__name__)
 # Define the database file path
 DB_FILE = "/config/pantry_data/pantry_data.db"
 
+# Ordered list of schema migrations. The database's PRAGMA user_version records how
+# many of them have been applied. Steps must be idempotent: DDL is not transactional
+# here, so a step interrupted part way through is simply run again on the next start.
+# Only ever append new steps to the end of this list.
+MIGRATIONS = []
 
-def migrate_database(db_file):
-    """Ensure the database exists and matches the expected schema."""
-    if not os.path.exists(db_file):
-        logger.info("Database file not found. Creating a new one...")
-        os.makedirs(os.path.dirname(db_file), exist_ok=True)
-        engine = create_engine(f'sqlite:///{db_file}')
-        Base.metadata.create_all(engine)
-        logger.info("Database created with the required schema.")
-        return
 
-    logger.info("Database file exists. Validating schema...")
+def migration(step):
+    """Register a migration step."""
+    MIGRATIONS.append(step)
+    return step
 
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
 
-    try:
-        # Check if the 'products' table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='products';")
-        table_exists = cursor.fetchone()
-        if not table_exists:
-            logger.info("Table 'products' not found. Creating it...")
-            engine = create_engine(f'sqlite:///{db_file}')
-            Base.metadata.create_all(engine)
-            logger.info("Table 'products' created.")
-            return
-
-        # Check if 'barcode' and 'image_front_small_url' columns exist
-        cursor.execute("PRAGMA table_info(products);")
-        existing_columns = {row[1] for row in cursor.fetchall()}
-        has_barcode = "barcode" in existing_columns
-        has_image_url = "image_front_small_url" in existing_columns
-
-        # Create a new table with the desired schema
-        logger.info("Creating a temporary table with the updated schema...")
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS products_new (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL UNIQUE,
-            url TEXT NOT NULL,
-            category_id INTEGER NOT NULL,
-            barcode TEXT DEFAULT NULL,
-            image_front_small_url TEXT DEFAULT NULL,
-            FOREIGN KEY (category_id) REFERENCES categories (id)
-        );
-        """)
-
-        # Build the data copy query dynamically based on existing columns
-        logger.info("Copying data from the old table to the new table...")
-        columns_to_copy = ["id", "name", "url", "category_id"]
-        if has_barcode:
-            columns_to_copy.append("barcode")
-        else:
-            logger.warning("Column 'barcode' not found in the old table. Setting default NULL.")
-        if has_image_url:
-            columns_to_copy.append("image_front_small_url")
+def get_schema_version(conn):
+    """Return the number of migrations applied to the database."""
+    return conn.exec_driver_sql("PRAGMA user_version;").scalar()
+
+
+def get_columns(conn, table):
+    return {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table});")}
+
+
+def is_column_indexed(conn, table, column):
+    """Return True if an index on the table starts with the given column."""
+    for index in conn.exec_driver_sql(f"PRAGMA index_list({table});").fetchall():
+        index_columns = conn.exec_driver_sql(f"PRAGMA index_info('{index[1]}');").fetchall()
+        if index_columns and index_columns[0][2] == column:
+            return True
+    return False
+
+
+@migration
+def create_tables(conn):
+    """Create any missing tables."""
+    Base.metadata.create_all(conn)
+
+
+@migration
+def add_product_metadata_columns(conn):
+    """Add the barcode and image_front_small_url columns to products."""
+    existing_columns = get_columns(conn, "products")
+    for column in ("barcode", "image_front_small_url"):
+        if column not in existing_columns:
+            logger.info(f"Adding column '{column}' to 'products'...")
+            conn.exec_driver_sql(f"ALTER TABLE products ADD COLUMN {column} TEXT DEFAULT NULL;")
+
+
+@migration
+def add_lookup_indexes(conn):
+    """Index products by category and barcode, and cover the counts join."""
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_products_category_id ON products (category_id);")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_counts_product_id_count ON counts (product_id, count);")
+
+    # Databases rebuilt by the old migration lost the unique constraint on barcode
+    if not is_column_indexed(conn, "products", "barcode"):
+        duplicates = conn.exec_driver_sql(
+            "SELECT barcode FROM products WHERE barcode IS NOT NULL GROUP BY barcode HAVING COUNT(*) > 1;"
+        ).fetchall()
+        if duplicates:
+            logger.warning(f"Duplicate barcodes found ({len(duplicates)}). Creating a non-unique barcode index.")
+            conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_products_barcode ON products (barcode);")
         else:
-            logger.warning("Column 'image_front_small_url' not found in the old table. Setting default NULL.")
+            conn.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS ix_products_barcode ON products (barcode);")
+
+
 
-        # Dynamically construct the SQL query for data copy
-        select_columns = ", ".join(columns_to_copy)
-        placeholders = ", ".join(f"COALESCE({col}, NULL)" if col not in existing_columns else col for col in columns_to_copy)
-        cursor.execute(f"""
-        INSERT INTO products_new ({select_columns})
-        SELECT {placeholders} FROM products;
-        """)
+@migration
+def add_openfoodfacts_cache(conn):
+    """Create the OpenFoodFacts lookup cache table."""
+    OpenFoodFactsCache.__table__.create(conn, checkfirst=True)
 
-        # Drop the old table
-        logger.info("Dropping the old 'products' table...")
-        cursor.execute("DROP TABLE products;")
 
-        # Rename the new table to the original table name
-        logger.info("Renaming 'products_new' to 'products'...")
-        cursor.execute("ALTER TABLE products_new RENAME TO products;")
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Every schema version, including databases created before versioning, has these tables
+REQUIRED_TABLES = ("categories", "products", "counts")
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+
+class InvalidDatabase(Exception):
+    """Raised when a file cannot be used as the pantry database."""
+
+
+def check_database_file(db_file):
+    """
+    Validate a database file before it is migrated or restored.
+    Only reads the file: checks the SQLite header, runs PRAGMA quick_check, and makes
+    sure the schema version is supported and the required tables exist.
+    Returns the schema version or raises InvalidDatabase.
+    """
+    with open(db_file, "rb") as f:
+        if f.read(len(SQLITE_HEADER)) != SQLITE_HEADER:
+            raise InvalidDatabase("The file is not an SQLite database.")
+
+    engine = create_engine(f'sqlite:///{db_file}')
+    try:
+        with engine.connect() as conn:
+            problems = [row[0] for row in conn.exec_driver_sql("PRAGMA quick_check;")]
+            if problems != ["ok"]:
+                raise InvalidDatabase(f"The database is corrupt: {'; '.join(problems[:5])}")
+
+            version = get_schema_version(conn)
+            if version > SCHEMA_VERSION:
+                raise InvalidDatabase(
+                    f"The database schema version {version} is newer than supported version {SCHEMA_VERSION}."
+                )
+
+            tables = {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table';")}
+            missing = [table for table in REQUIRED_TABLES if table not in tables]
+            if missing:
+                raise InvalidDatabase(f"The database is missing tables: {', '.join(missing)}")
+        return version
+    except InvalidDatabase:
+        raise
+    except Exception as e:
+        raise InvalidDatabase(f"The database could not be read: {e}")
+    finally:
+        engine.dispose()
+
+
+def migrate_database(db_file):
+    """
+    Ensure the database exists and apply any pending migrations.
+    Does nothing beyond reading user_version when the schema is already current.
+    Returns True if any migration was applied.
+    """
+    if not os.path.exists(db_file):
+        logger.info("Database file not found. Creating a new one...")
+        os.makedirs(os.path.dirname(db_file), exist_ok=True)
+
+    engine = create_engine(f'sqlite:///{db_file}')
+    try:
+        with engine.begin() as conn:
+            version = get_schema_version(conn)
+            if version == SCHEMA_VERSION:
+                logger.info(f"Database schema is current (version {version}).")
+                return False
+            if version > SCHEMA_VERSION:
+                logger.warning(f"Database schema version {version} is newer than supported version {SCHEMA_VERSION}.")
+                return False
+
+            for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+                logger.info(f"Applying migration {number}/{SCHEMA_VERSION}: {step.__doc__}")
+                step(conn)
+                conn.exec_driver_sql(f"PRAGMA user_version = {number};")
 
-        conn.commit()
         logger.info("Database migration completed successfully.")
+        return True
 
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error during database migration: {e}")
         raise
     finally:
-        conn.close()
+        engine.dispose()
 
 
 # Main entry point for the migration script
@@ -1,8 +1,9 @@
 # pantry_tracker/webapp/models.py
 
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index, Boolean, Text
 from sqlalchemy.orm import relationship
+import datetime
 
 Base = declarative_base()
 
@@ -20,7 +21,7 @@ class Product(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True, nullable=False)
     url = Column(String, nullable=False)
-    category_id = Column(Integer, ForeignKey('categories.id'), nullable=False)
+    category_id = Column(Integer, ForeignKey('categories.id'), nullable=False, index=True)
     barcode = Column(String, unique=True, nullable=True)  # Existing optional barcode field
     image_front_small_url = Column(String, nullable=True)  # New optional image URL field
     
@@ -29,9 +30,32 @@ class Product(Base):
 
 class Count(Base):
     __tablename__ = 'counts'
+    # Covers the counts/products join so counts can be read without touching the table
+    __table_args__ = (Index('ix_counts_product_id_count', 'product_id', 'count'),)
     
     id = Column(Integer, primary_key=True)
     product_id = Column(Integer, ForeignKey('products.id'), unique=True, nullable=False)
     count = Column(Integer, nullable=False, default=0)
     
     product = relationship("Product", back_populates="count")
+
+class ChangeLog(Base):
+    __tablename__ = 'change_log'
+    # AUTOINCREMENT guarantees ids are never reused after compaction, so they are safe to use as a cursor
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    id = Column(Integer, primary_key=True)
+    entity_type = Column(String, nullable=False)  # 'count', 'product', 'category' or 'database'
+    action = Column(String, nullable=False)  # 'create', 'update', 'delete' or 'reset'
+    name = Column(String, nullable=True)
+    old_name = Column(String, nullable=True)  # Set when an entity was renamed
+    count = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+class OpenFoodFactsCache(Base):
+    __tablename__ = 'openfoodfacts_cache'
+    
+    barcode = Column(String, primary_key=True)
+    found = Column(Boolean, nullable=False)  # False caches "not found" so unknown barcodes are not refetched
+    data = Column(Text, nullable=True)  # JSON of the extracted product fields
+    fetched_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
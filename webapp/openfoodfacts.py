@@ -0,0 +1,350 @@
+# pantry_tracker/webapp/openfoodfacts.py
+
+import os
+import json
+import time
+import random
+import logging
+import datetime
+import threading
+from models import OpenFoodFactsCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://world.openfoodfacts.org"
+USER_AGENT = "PantryManager/1.0.5 (mint@mintcreg.co.uk)"
+
+
+class LookupFailed(Exception):
+    """Raised when OpenFoodFacts could not be reached and nothing is cached for the barcode."""
+
+
+class UpstreamError(Exception):
+    """Raised when a request to OpenFoodFacts fails (timeout, connection error, error status or invalid body)."""
+
+
+class CircuitOpen(UpstreamError):
+    """Raised without contacting OpenFoodFacts while the circuit breaker is open."""
+
+
+class UpstreamBusy(UpstreamError):
+    """Raised when every upstream connection slot stays in use until the deadline."""
+
+
+# Status codes worth retrying: the server is overloaded or briefly unavailable
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def extract_product(barcode, data):
+    """Extract the fields used by the app from an OpenFoodFacts API response, or None if unknown."""
+    if data.get('status') != 1:
+        return None
+    product_data = data.get('product', {})
+    return {
+        "name": product_data.get('product_name', 'Unknown Product'),
+        "barcode": barcode,
+        "category": product_data.get('categories', 'Uncategorized').split(',')[0].strip(),
+        "image_front_small_url": product_data.get('image_front_small_url', None)
+    }
+
+
+class OpenFoodFactsClient:
+    """
+    HTTP client for the OpenFoodFacts API shared by every thread of a worker process.
+    - Connections are pooled and kept alive, so repeat lookups skip the TCP/TLS handshake.
+    - At most max_connections requests are in flight; others wait for a free slot.
+    - Timeouts, connection errors and 429/5xx responses are retried with jittered backoff,
+      all within a single deadline of `timeout` seconds per lookup.
+    - After failure_threshold failed lookups in a row the circuit opens and lookups fail
+      immediately for reset_seconds. Then one trial request decides whether it closes again.
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, timeout=5, max_connections=4, retries=2,
+                 backoff=0.25, failure_threshold=5, reset_seconds=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        self.short_circuited = 0
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._session = None
+        self._session_pid = None
+
+    def _get_session(self):
+        # Sessions are created per process so pooled sockets are never shared across fork().
+        # requests is imported here, on first use, as it is one of the slowest imports at startup.
+        if self._session is None or self._session_pid != os.getpid():
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_connections)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["User-Agent"] = USER_AGENT
+            self._session, self._session_pid = session, os.getpid()
+        return self._session
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_seconds:
+            return "open"
+        return "half-open"
+
+    def _before_request(self):
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self._trial_in_flight):
+                self.short_circuited += 1
+                raise CircuitOpen("OpenFoodFacts circuit breaker is open.")
+            if state == "half-open":
+                self._trial_in_flight = True
+
+    def _record(self, success):
+        with self._lock:
+            self._trial_in_flight = False
+            if success:
+                if self._opened_at is not None:
+                    logger.info("OpenFoodFacts is healthy again. Circuit breaker closed.")
+                self._consecutive_failures = 0
+                self._opened_at = None
+                return
+            self.failures += 1
+            self._consecutive_failures += 1
+            if self._opened_at is not None or self._consecutive_failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                logger.warning(
+                    f"OpenFoodFacts failed {self._consecutive_failures} times in a row. "
+                    f"Failing fast for {self.reset_seconds}s."
+                )
+
+    def fetch_product(self, barcode):
+        """
+        Fetch a product from the OpenFoodFacts API.
+        Returns the extracted product fields, or None if the barcode is unknown.
+        Raises UpstreamError (including CircuitOpen and UpstreamBusy) on failure.
+        """
+        self._before_request()
+        try:
+            data = self._get_with_retries(f"{self.base_url}/api/v0/product/{barcode}.json")
+        except Exception as e:
+            # Any failure, including an invalid response body, counts against the breaker
+            self._record(False)
+            if isinstance(e, UpstreamError):
+                raise
+            raise UpstreamError(str(e)) from e
+        self._record(True)
+        return extract_product(barcode, data)
+
+    def _get_with_retries(self, url):
+        import requests
+        deadline = time.monotonic() + self.timeout
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if not self._slots.acquire(timeout=max(remaining, 0)):
+                raise UpstreamBusy("No free connection to OpenFoodFacts.")
+            try:
+                with self._lock:
+                    self.requests += 1
+                remaining = max(deadline - time.monotonic(), 0.1)
+                response = self._get_session().get(url, timeout=remaining)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    return response.json()
+                error = requests.HTTPError(f"{response.status_code} from OpenFoodFacts", response=response)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                error = e
+            finally:
+                self._slots.release()
+
+            delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+            if attempt >= self.retries or time.monotonic() + delay >= deadline:
+                raise error
+            attempt += 1
+            with self._lock:
+                self.retried += 1
+            logger.debug(f"Retrying OpenFoodFacts request in {delay:.2f}s ({error}).")
+            time.sleep(delay)
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "base_url": self.base_url,
+            "requests": self.requests,
+            "retries": self.retried,
+            "failures": self.failures,
+            "short_circuited": self.short_circuited,
+            "max_connections": self.max_connections,
+        }
+
+
+class _PendingLookup:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ProductLookupCache:
+    """
+    Read-through cache of OpenFoodFacts lookups stored in the openfoodfacts_cache table.
+    Found products are kept for positive_ttl and unknown barcodes for negative_ttl. Expired
+    entries are still served when the API cannot be reached, so repeat scans work offline.
+    Concurrent lookups of the same barcode in one process share a single upstream request.
+    """
+
+    def __init__(self, session_factory, fetch, positive_ttl, negative_ttl):
+        self.session_factory = session_factory
+        self.fetch = fetch
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale = 0
+        self.errors = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, barcode, before_fetch=None):
+        """
+        Return (product, source) where product is None for an unknown barcode and source is
+        "cache", "openfoodfacts" or "stale". Raises LookupFailed if the API cannot be reached
+        and nothing is cached. before_fetch is called only when the API is about to be
+        contacted, which lets callers rate limit upstream requests without delaying cache hits.
+        """
+        entry = self._read(barcode)
+        if entry is not None and self._is_fresh(entry):
+            with self._lock:
+                if entry["found"]:
+                    self.hits += 1
+                else:
+                    self.negative_hits += 1
+            return entry["product"], "cache"
+
+        with self._lock:
+            pending = self._pending.get(barcode)
+            leader = pending is None
+            if leader:
+                pending = self._pending[barcode] = _PendingLookup()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.result
+
+        try:
+            pending.result = self._refresh(barcode, entry, before_fetch)
+            return pending.result
+        except BaseException as e:
+            # Waiters re-raise whatever the leader hit, not only LookupFailed, so they
+            # never return an empty result
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._pending[barcode]
+            pending.done.set()
+
+    def _refresh(self, barcode, entry, before_fetch=None):
+        try:
+            if before_fetch is not None:
+                before_fetch()
+            product = self.fetch(barcode)
+        except UpstreamError as e:
+            with self._lock:
+                self.errors += 1
+            if entry is not None:
+                logger.warning(f"OpenFoodFacts unavailable ({e}). Serving cached data for {barcode}.")
+                with self._lock:
+                    self.stale += 1
+                return entry["product"], "stale"
+            logger.error(f"Error fetching product from OpenFoodFacts: {e}")
+            raise LookupFailed(str(e))
+
+        self._write(barcode, product)
+        if product:
+            logger.info(f"Product fetched from OpenFoodFacts: {product}")
+        else:
+            logger.warning(f"Product with barcode {barcode} not found in OpenFoodFacts.")
+        return product, "openfoodfacts"
+
+    def _is_fresh(self, entry):
+        ttl = self.positive_ttl if entry["found"] else self.negative_ttl
+        return datetime.datetime.utcnow() - entry["fetched_at"] < ttl
+
+    def _read(self, barcode):
+        session = self.session_factory()
+        try:
+            row = session.get(OpenFoodFactsCache, barcode)
+            if row is None:
+                return None
+            return {
+                "found": row.found,
+                "product": json.loads(row.data) if row.found else None,
+                "fetched_at": row.fetched_at,
+            }
+        finally:
+            self.session_factory.remove()
+
+    def _write(self, barcode, product):
+        session = self.session_factory()
+        try:
+            session.merge(OpenFoodFactsCache(
+                barcode=barcode,
+                found=product is not None,
+                data=json.dumps(product) if product is not None else None,
+                fetched_at=datetime.datetime.utcnow()
+            ))
+            session.commit()
+        except Exception as e:
+            # A failed cache write must not fail the lookup itself
+            session.rollback()
+            logger.error(f"Error caching OpenFoodFacts result for {barcode}: {e}")
+        finally:
+            self.session_factory.remove()
+
+    def clear(self):
+        """Delete every cached lookup and return the number removed."""
+        session = self.session_factory()
+        try:
+            removed = session.query(OpenFoodFactsCache).delete()
+            session.commit()
+            return removed
+        finally:
+            self.session_factory.remove()
+
+    def stats(self):
+        session = self.session_factory()
+        try:
+            entries = session.query(OpenFoodFactsCache).count()
+        finally:
+            self.session_factory.remove()
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "stale": self.stale,
+            "errors": self.errors,
+            "positive_ttl_hours": self.positive_ttl.total_seconds() / 3600,
+            "negative_ttl_hours": self.negative_ttl.total_seconds() / 3600,
+        }
@@ -1,6 +1,6 @@
 # pantry_tracker/webapp/schemas.py
 
-from marshmallow import Schema, fields, validate, validates, ValidationError
+from marshmallow import Schema, fields, validate, validates, validates_schema, ValidationError
 
 class CategorySchema(Schema):
     """
@@ -39,6 +39,14 @@ class ProductSchema(Schema):
             raise ValidationError("Barcode must be between 8 to 13 digits.")
 
 
+class ImportProductSchema(ProductSchema):
+    """
+    Schema for a product row in a bulk import.
+    Accepts an optional starting count so exports can be imported again.
+    """
+    count = fields.Int(required=False, load_default=0, validate=validate.Range(min=0))
+
+
 class UpdateProductSchema(Schema):
     """
     Schema for updating an existing product's details.
@@ -57,3 +65,19 @@ class UpdateProductSchema(Schema):
                 raise ValidationError("Barcode must be numeric.")
             if value and not (8 <= len(value) <= 13):
                 raise ValidationError("Barcode must be between 8 to 13 digits.")
+
+
+class CountOperationSchema(Schema):
+    """
+    Schema for a single operation in a batch count update.
+    The product is identified by either its name or its barcode.
+    """
+    product_name = fields.Str(required=False, validate=validate.Length(min=1, max=100))
+    barcode = fields.Str(required=False, validate=validate.Length(min=8, max=13))
+    action = fields.Str(required=True, validate=validate.OneOf(["increase", "decrease"]))
+    amount = fields.Int(required=False, load_default=1, validate=validate.Range(min=1))
+
+    @validates_schema
+    def validate_product_reference(self, data, **kwargs):
+        if bool(data.get("product_name")) == bool(data.get("barcode")):
+            raise ValidationError("Provide either product_name or barcode.")
@@ -0,0 +1,117 @@
+# pantry_tracker/webapp/settings.py
+
+import io
+import os
+import time
+import fcntl
+import logging
+import threading
+import configparser
+from versioning import SharedCounters
+
+logger = logging.getLogger(__name__)
+
+CHECK_INTERVAL = 2.0  # Seconds between checks of config.ini for changes made outside the app
+
+
+class SettingsStore:
+    """
+    Parsed copy of config.ini kept in memory.
+    - read() returns the cached parser. The file is only parsed again after a worker wrote
+      it (a counter in shared memory, checked on every call) or when its mtime, size or
+      inode changed (a stat every CHECK_INTERVAL seconds, for edits made by hand).
+    - update() applies a change to the latest file contents and replaces the file
+      atomically, holding a lock file so concurrent writers in any worker never lose
+      each other's changes.
+    Parsers returned by read() are never modified; an update builds a new one. Callers
+    must not modify them either.
+    """
+
+    def __init__(self, path, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.lock_file = f"{path}.lock"
+        self.check_interval = check_interval
+        self.reloads = 0
+        self.writes = 0
+        self._versions = SharedCounters(("settings",))
+        self._config = configparser.ConfigParser()
+        self._signature = None
+        self._version = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _parse(self):
+        parser = configparser.ConfigParser()
+        parser.read(self.path)
+        return parser
+
+    def read(self):
+        """Return the current settings, parsing config.ini again only if it changed."""
+        now = time.monotonic()
+        version = self._versions.get("settings")
+        if (version == self._version and self._checked_at is not None
+                and now - self._checked_at < self.check_interval):
+            return self._config
+        with self._lock:
+            signature = self._stat()
+            if signature != self._signature or version != self._version:
+                self._config = self._parse()
+                self._signature = signature
+                self.reloads += 1
+                logger.debug(f"Settings loaded from {self.path}.")
+            self._version = version
+            self._checked_at = now
+            return self._config
+
+    def get(self, section, option, fallback=None):
+        return self.read().get(section, option, fallback=fallback)
+
+    def update(self, apply):
+        """
+        Call apply(parser) with a fresh copy of the settings on disk and write the result
+        back. Nothing is written if apply left the settings unchanged.
+        Returns True if config.ini was written.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        lock_fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            parser = self._parse()
+            before = self._serialize(parser)
+            apply(parser)
+            text = self._serialize(parser)
+            if text == before and os.path.exists(self.path):
+                return False
+
+            # Write a complete new file and rename it over the old one, so a reader in any
+            # worker sees either the old settings or the new ones, never a partial file
+            temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+
+            with self._lock:
+                self.writes += 1
+                self._config = parser
+                self._signature = self._stat()
+                self._version = self._versions.increment("settings")[0]
+                self._checked_at = time.monotonic()
+            return True
+        finally:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+
+    @staticmethod
+    def _serialize(parser):
+        output = io.StringIO()
+        parser.write(output)
+        return output.getvalue()
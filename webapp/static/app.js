@@ -134,6 +134,24 @@ const appendApiKey = (url) => {
   return urlObj.toString();
 };
 
+//////////////////////////////////////
+// Thumbnail URL of a product image, served from the local image cache
+//////////////////////////////////////
+const hashString = (value) => {
+  let hash = 5381;
+  for (let i = 0; i < value.length; i++) {
+    hash = ((hash << 5) + hash + value.charCodeAt(i)) | 0;
+  }
+  return (hash >>> 0).toString(36);
+};
+
+const productImageUrl = (product) => {
+  const urlObj = new URL(appendApiKey(`${basePath}products/${encodeURIComponent(product.name)}/image`));
+  // Changes with the image URL, so the browser can keep each thumbnail cached indefinitely
+  urlObj.searchParams.append('v', hashString(product.url));
+  return urlObj.toString();
+};
+
 // Add toggleColumnSettings here:
 const toggleColumnSettings = () => {
   const settingsContainer = document.getElementById('column-settings-container');
@@ -310,7 +328,8 @@ const addCategory = async () => {
     const response = await fetch(appendApiKey(`${basePath}categories`), {
       method: 'POST',
       headers: {
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
+        'Prefer': 'return=minimal'
       },
       body: JSON.stringify({ name: categoryName })
     });
@@ -321,7 +340,7 @@ const addCategory = async () => {
     }
 
     alert('Category added successfully');
-    fetchCategories(); // Refresh the category list
+    if (!liveUpdatesConnected) fetchCategories(); // Refresh the category list
 
     // Clear the input field
     document.getElementById('new-category-input').value = '';
@@ -343,7 +362,8 @@ const removeCategory = async (categoryName) => {
     const response = await fetch(appendApiKey(`${basePath}categories`), {
       method: 'DELETE',
       headers: {
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
+        'Prefer': 'return=minimal'
       },
       body: JSON.stringify({ name: categoryName })
     });
@@ -354,7 +374,7 @@ const removeCategory = async (categoryName) => {
     }
 
     alert('Category removed successfully');
-    fetchCategories(); // Refresh the category list
+    if (!liveUpdatesConnected) fetchCategories(); // Refresh the category list
   } catch (error) {
     console.error('Error removing category:', error);
     alert(error.message);
@@ -406,7 +426,8 @@ const saveEditedCategory = async () => {
     const response = await fetch(appendApiKey(`${basePath}categories/${encodeURIComponent(oldName)}`), {
       method: 'PUT',
       headers: {
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
+        'Prefer': 'return=minimal'
       },
       body: JSON.stringify({ new_name: newName })
     });
@@ -419,7 +440,7 @@ const saveEditedCategory = async () => {
 
     alert('Category updated successfully');
     closeEditCategoryModal();
-    fetchCategories(); // Refresh the category list
+    if (!liveUpdatesConnected) fetchCategories(); // Refresh the category list
   } catch (error) {
     console.error('Error editing category:', error);
     alert(error.message);
@@ -427,11 +448,27 @@ const saveEditedCategory = async () => {
 };
 
 //////////////////////////////////////
-// Fetch products from the backend
+// Fetch products from the backend one page at a time
 ////////////////////////////////////
-const fetchProducts = async () => {
+const PRODUCT_PAGE_SIZE = 200;
+let productsNextCursor = null;
+// The server sorts the whole list, so every page continues the order chosen in the table header
+let productSort = { field: 'name', order: 'asc' };
+let productsRequest = 0;
+
+const fetchProducts = async (loadMore = false) => {
+  // Responses to requests made before a newer one (e.g. after a sort change) are ignored
+  const request = ++productsRequest;
   try {
-    const response = await fetch(appendApiKey(`${basePath}products`), {
+    const url = new URL(appendApiKey(`${basePath}products`));
+    url.searchParams.set('limit', PRODUCT_PAGE_SIZE);
+    url.searchParams.set('sort', productSort.field);
+    url.searchParams.set('order', productSort.order);
+    if (loadMore && productsNextCursor) {
+      url.searchParams.set('cursor', productsNextCursor);
+    }
+
+    const response = await fetch(url.toString(), {
       method: 'GET',
       headers: {
         'Content-Type': 'application/json'
@@ -442,13 +479,68 @@ const fetchProducts = async () => {
       throw new Error(`Failed to fetch products: ${response.statusText}`);
     }
 
-    products = await response.json();
+    const page = await response.json();
+    if (request !== productsRequest) return;
+    products = loadMore ? products.concat(page.products) : page.products;
+    productsNextCursor = page.next_cursor;
     displayProducts(products);
   } catch (error) {
     console.error('Error fetching products:', error);
   }
 };
 
+//////////////////////////////////////
+// Live updates via Server-Sent Events
+//////////////////////////////////////
+let liveUpdatesConnected = false;
+let liveRefreshTimer = null;
+const pendingLiveRefresh = new Set();
+
+// Batch refreshes so a burst of changes results in a single fetch per list
+const scheduleLiveRefresh = (...lists) => {
+  lists.forEach((list) => pendingLiveRefresh.add(list));
+  clearTimeout(liveRefreshTimer);
+  liveRefreshTimer = setTimeout(() => {
+    if (pendingLiveRefresh.has('categories')) fetchCategories();
+    if (pendingLiveRefresh.has('products')) fetchProducts();
+    pendingLiveRefresh.clear();
+  }, 100);
+};
+
+const subscribeToChanges = () => {
+  if (!window.EventSource) {
+    console.warn('EventSource is not supported. Live updates are disabled.');
+    return;
+  }
+
+  const source = new EventSource(appendApiKey(`${basePath}events`));
+
+  source.onopen = () => {
+    liveUpdatesConnected = true;
+    console.log('Live updates connected.');
+  };
+
+  source.addEventListener('change', (event) => {
+    const change = JSON.parse(event.data);
+    if (change.type === 'product') {
+      scheduleLiveRefresh('products');
+    } else if (change.type === 'category' || change.type === 'database') {
+      // Category renames and deletions also change the category shown for products
+      scheduleLiveRefresh('categories', 'products');
+    }
+  });
+
+  source.addEventListener('resync', () => {
+    scheduleLiveRefresh('categories', 'products');
+  });
+
+  source.onerror = () => {
+    // The browser reconnects automatically; refresh manually until it does
+    liveUpdatesConnected = false;
+    console.warn('Live updates disconnected. Reconnecting...');
+  };
+};
+
 //////////////////////////////////////
 // Global variable for column visibility
 //////////////////////////////////////
@@ -548,7 +640,7 @@ const displayProducts = (products) => {
     const tableBody = document.createElement('tbody');
 
     products.forEach((product) => {
-      const imageUrl = product.url; // Assuming 'url' contains the image URL
+      const imageUrl = product.url ? productImageUrl(product) : ''; // 'url' contains the image URL
       const imageAlt = `${product.name} Image`;
 
       const barcodeLink = product.barcode
@@ -561,7 +653,7 @@ const displayProducts = (products) => {
         ${columnVisibility.category ? `<td>${product.category}</td>` : ''}
         ${
           columnVisibility.image
-            ? `<td>${imageUrl ? `<img src="${imageUrl}" alt="${imageAlt}" class="product-image">` : 'No Image'}</td>`
+            ? `<td>${imageUrl ? `<img src="${imageUrl}" alt="${imageAlt}" class="product-image" loading="lazy">` : 'No Image'}</td>`
             : ''
         }
         ${columnVisibility.barcode ? `<td>${barcodeLink}</td>` : ''}
@@ -596,6 +688,18 @@ const displayProducts = (products) => {
     `;
   }
 
+  // Offer the next page when the server has more products
+  if (productsNextCursor) {
+    const loadMoreContainer = document.createElement('div');
+    loadMoreContainer.classList.add('add-product-button-container');
+    const loadMoreButton = document.createElement('button');
+    loadMoreButton.classList.add('add-product-btn');
+    loadMoreButton.textContent = 'Load More';
+    loadMoreButton.onclick = () => fetchProducts(true);
+    loadMoreContainer.appendChild(loadMoreButton);
+    productsContainer.appendChild(loadMoreContainer);
+  }
+
   // Add the styled "Add Product" button
   const buttonContainer = document.createElement('div');
   buttonContainer.classList.add('add-product-button-container'); // Add the container class
@@ -624,8 +728,10 @@ document.addEventListener('DOMContentLoaded', () => {
 const initEditProductModal = async (encodedProductName) => {
   const productName = decodeURIComponent(encodedProductName);
   try {
-    // Fetch products
-    const productResponse = await fetch(appendApiKey(`${basePath}products`), {
+    // Fetch matching products only instead of the whole catalog
+    const productUrl = new URL(appendApiKey(`${basePath}products`));
+    productUrl.searchParams.set('prefix', productName);
+    const productResponse = await fetch(productUrl.toString(), {
       method: 'GET',
       headers: {
         'Content-Type': 'application/json'
@@ -739,7 +845,8 @@ const saveEditedProduct = async () => {
     const response = await fetch(appendApiKey(`${basePath}products/${encodeURIComponent(oldName)}`), {
       method: 'PUT',
       headers: {
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
+        'Prefer': 'return=minimal'
       },
       body: JSON.stringify(payload)
     });
@@ -752,7 +859,7 @@ const saveEditedProduct = async () => {
 
     alert('Product updated successfully');
     closeEditProductModal();
-    fetchProducts(); // Refresh the product list
+    if (!liveUpdatesConnected) fetchProducts(); // Refresh the product list
   } catch (error) {
     console.error('Error editing product:', error);
     alert(error.message);
@@ -797,7 +904,8 @@ const addProductFromForm = async () => {
     const response = await fetch(appendApiKey(`${basePath}products`), {
       method: 'POST',
       headers: {
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
+        'Prefer': 'return=minimal'
       },
       body: JSON.stringify(payload)
     });
@@ -809,7 +917,7 @@ const addProductFromForm = async () => {
 
     alert('Product added successfully.');
     closeAddProductModal(); // Close the modal after adding
-    fetchProducts(); // Refresh the product list
+    if (!liveUpdatesConnected) fetchProducts(); // Refresh the product list
   } catch (error) {
     console.error('Error adding product:', error);
     alert(error.message);
@@ -831,7 +939,8 @@ const removeProduct = async (productName) => {
     const response = await fetch(appendApiKey(`${basePath}products`), {
       method: 'DELETE',
       headers: {
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
+        'Prefer': 'return=minimal'
       },
       body: JSON.stringify({ name: productName })
     });
@@ -842,7 +951,7 @@ const removeProduct = async (productName) => {
     }
 
     alert('Product removed successfully');
-    fetchProducts(); // Refresh the product list
+    if (!liveUpdatesConnected) fetchProducts(); // Refresh the product list
   } catch (error) {
     console.error('Error removing product:', error);
     alert(error.message);
@@ -855,18 +964,16 @@ const removeProduct = async (productName) => {
 const sortProducts = (field) => {
   const sortOrder = productSortOrder[field];
 
-  // Sort the products array based on the current sort order
-  products.sort((a, b) => {
-    if (a[field] < b[field]) return sortOrder === 'asc' ? -1 : 1;
-    if (a[field] > b[field]) return sortOrder === 'asc' ? 1 : -1;
-    return 0;
-  });
+  // Only the first page is loaded, so ask the server for the list in the new order
+  // and start again from the first page
+  productSort = { field, order: sortOrder };
+  productsNextCursor = null;
 
   // Toggle the sort order for next click
   productSortOrder[field] = (sortOrder === 'asc') ? 'desc' : 'asc';
 
-  // Re-display the sorted products
-  displayProducts(products);
+  // Fetch and display the sorted products
+  fetchProducts();
   
   // Update the arrow in the table headers
   updateProductHeaderArrows(field);
@@ -984,6 +1091,9 @@ document.addEventListener("DOMContentLoaded", async () => {
   await fetchCategories();
   // Default tab: 'products'
   showTab('products');
+
+  // Refresh lists when changes are made elsewhere (other tabs, Home Assistant, API clients)
+  subscribeToChanges();
   
   displayColumnSettings();
 
@@ -1124,8 +1234,48 @@ function onBarcodeDetected(result) {
   fetchProductData(code);
 }
 
+// Look the barcode up locally and offer to increase the count of the matching product.
+// Returns true if the barcode belongs to an existing product, so OpenFoodFacts is not needed.
+const countScannedProduct = async (barcode) => {
+  try {
+    const response = await fetch(appendApiKey(`${basePath}products/by_barcode/${encodeURIComponent(barcode)}`), {
+      method: 'GET'
+    });
+    if (!response.ok) {
+      return false;
+    }
+
+    const product = (await response.json()).product;
+    if (confirm(`"${product.name}" is already in your pantry (count: ${product.count}). Add one more?`)) {
+      const updateResponse = await fetch(appendApiKey(`${basePath}update_count`), {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ barcode: barcode, action: 'increase', amount: 1 })
+      });
+      const result = await updateResponse.json();
+      if (!updateResponse.ok || result.status !== 'ok') {
+        throw new Error(result.message || `Failed to update count: ${updateResponse.statusText}`);
+      }
+
+      alert(`"${result.product_name}" count is now ${result.count}.`);
+      if (!liveUpdatesConnected) fetchProducts(); // Refresh the product list
+    }
+    return true;
+  } catch (error) {
+    console.error('Error looking up barcode:', error);
+    return false;
+  }
+};
+
 // Fetch product data from API based on the scanned barcode
 const fetchProductData = async (barcode) => {
+  // Known barcodes are counted locally instead of being fetched from OpenFoodFacts again
+  if (await countScannedProduct(barcode)) {
+    return;
+  }
+
   try {
     const response = await fetch(appendApiKey(`${basePath}fetch_product?barcode=${barcode}`), {
       method: 'GET'
@@ -1421,4 +1571,4 @@ async function toggleTheme() {
   } catch (error) {
     console.error('Error saving theme:', error);
   }
-}
\ No newline at end of file
+}
\ No newline at end of file
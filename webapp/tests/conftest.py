@@ -0,0 +1,39 @@
+# pantry_tracker/webapp/tests/conftest.py
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its data directory at import time, so point it at a throwaway one first
+os.environ.setdefault("PANTRY_DATA_DIR", tempfile.mkdtemp(prefix="pantry_test_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as pantry_app  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    return pantry_app.app.test_client()
+
+
+@pytest.fixture
+def headers():
+    return {"X-API-KEY": pantry_app.config["Settings"]["api_key"]}
+
+
+@pytest.fixture
+def add_product(client, headers):
+    """Create a product, and its category if needed, and return its name."""
+    def add(name, category="Tests", **fields):
+        client.post("/categories", headers=headers, json={"name": category})
+        response = client.post("/products", headers=headers, json={
+            "name": name,
+            "url": "https://example.com/image.jpg",
+            "category": category,
+            **fields,
+        })
+        assert response.status_code == 200
+        return name
+    return add
@@ -0,0 +1,75 @@
+# pantry_tracker/webapp/tests/test_auth.py
+
+import auth
+import app as pantry_app
+
+
+def add_api_key(name, secret, rate_limit=0):
+    def apply(parser):
+        section = f"ApiKey.{name}"
+        if not parser.has_section(section):
+            parser.add_section(section)
+        parser.set(section, "key", secret)
+        parser.set(section, "rate_limit", str(rate_limit))
+    pantry_app.settings.update(apply)
+
+
+def test_missing_and_invalid_keys_are_rejected(client, headers):
+    rejected = pantry_app.api_key_auth.stats()["rejected"]
+
+    assert client.get("/counts").status_code == 401
+    assert client.get("/counts", headers={"X-API-KEY": "not the key"}).status_code == 403
+    assert client.get("/counts", headers={"X-API-KEY": headers["X-API-KEY"][:-1]}).status_code == 403
+    assert client.get("/counts", headers=headers).status_code == 200
+    assert client.get(f"/counts?api_key={headers['X-API-KEY']}").status_code == 200
+
+    assert pantry_app.api_key_auth.stats()["rejected"] == rejected + 2
+
+
+def test_exempt_routes_need_no_key(client):
+    assert client.get("/health").status_code == 200
+    assert client.get("/counts", headers={"X-Ingress-Path": "/api/hassio_ingress/x"}).status_code == 200
+
+
+def test_named_key_is_accepted(client):
+    add_api_key("scanner", "scanner-secret")
+    assert client.get("/counts", headers={"X-API-KEY": "scanner-secret"}).status_code == 200
+
+
+def test_every_key_is_compared(monkeypatch):
+    add_api_key("compared", "compared-secret")
+    keys = pantry_app.api_key_auth.keys()
+    calls = []
+
+    def compare_digest(a, b):
+        calls.append(a)
+        return a == b
+
+    monkeypatch.setattr(auth.hmac, "compare_digest", compare_digest)
+
+    # The time taken must not depend on whether or where the key matches
+    assert pantry_app.api_key_auth.authenticate(keys[0].secret.decode()) == keys[0].name
+    assert len(calls) == len(keys)
+    calls.clear()
+    try:
+        pantry_app.api_key_auth.authenticate("no such key")
+    except auth.InvalidApiKey:
+        pass
+    assert len(calls) == len(keys)
+
+
+def test_rate_limit_applies_per_key(client, headers, monkeypatch):
+    # A window far longer than the test, so it cannot roll over half way
+    monkeypatch.setattr(pantry_app.api_key_auth.limits, "window", 10 ** 9)
+    add_api_key("limited", "limited-secret", rate_limit=2)
+    limited = {"X-API-KEY": "limited-secret"}
+
+    assert client.get("/counts", headers=limited).status_code == 200
+    assert client.get("/counts", headers=limited).status_code == 200
+    response = client.get("/counts", headers=limited)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+
+    # Other keys are not affected
+    assert client.get("/counts", headers=headers).status_code == 200
+    assert pantry_app.api_key_auth.stats()["limited"] >= 1
@@ -0,0 +1,74 @@
+# pantry_tracker/webapp/tests/test_changes.py
+
+
+def latest_cursor(client, headers):
+    # A cursor ahead of the log always resyncs to the latest entry
+    data = client.get("/counts/changes?since=1000000000", headers=headers).get_json()
+    assert data["resync"] is True
+    return data["cursor"]
+
+
+def update_count(client, headers, name, action="increase"):
+    response = client.post("/update_count", headers=headers, json={"product_name": name, "action": action})
+    assert response.status_code == 200
+
+
+def test_changes_after_the_cursor(client, headers, add_product):
+    name = add_product("Delta rice")
+    cursor = latest_cursor(client, headers)
+
+    update_count(client, headers, name)
+    update_count(client, headers, name)
+
+    data = client.get(f"/counts/changes?since={cursor}", headers=headers).get_json()
+    assert data["resync"] is False
+    assert data["has_more"] is False
+    assert [(change["type"], change["name"], change["count"]) for change in data["changes"]] == [
+        ("count", name, 1), ("count", name, 2)
+    ]
+    assert data["changes"][0]["entity_id"] == "sensor.product_delta_rice"
+    assert data["cursor"] == data["changes"][-1]["id"]
+
+    data = client.get(f"/counts/changes?since={data['cursor']}", headers=headers).get_json()
+    assert data["changes"] == []
+    assert data["has_more"] is False
+
+
+def test_changes_are_paged(client, headers, add_product):
+    name = add_product("Delta pasta")
+    cursor = latest_cursor(client, headers)
+    for _ in range(3):
+        update_count(client, headers, name)
+
+    counts = []
+    while True:
+        data = client.get(f"/counts/changes?since={cursor}&limit=2", headers=headers).get_json()
+        assert len(data["changes"]) <= 2
+        counts += [change["count"] for change in data["changes"]]
+        cursor = data["cursor"]
+        if not data["has_more"]:
+            break
+    assert counts == [1, 2, 3]
+
+
+def test_product_changes_are_logged(client, headers, add_product):
+    cursor = latest_cursor(client, headers)
+    name = add_product("Delta beans")
+
+    data = client.get(f"/counts/changes?since={cursor}", headers=headers).get_json()
+    assert ("product", "create", name) in [
+        (change["type"], change["action"], change["name"]) for change in data["changes"]
+    ]
+
+
+def test_cursor_ahead_of_the_log_resyncs(client, headers):
+    data = client.get("/counts/changes?since=1000000000", headers=headers).get_json()
+    assert data["resync"] is True
+    assert data["changes"] == []
+    assert data["cursor"] < 1000000000
+
+
+def test_invalid_cursor_is_rejected(client, headers):
+    assert client.get("/counts/changes?since=abc", headers=headers).status_code == 400
+    assert client.get("/counts/changes?since=-1", headers=headers).status_code == 400
+    assert client.get("/counts/changes?limit=0", headers=headers).status_code == 400
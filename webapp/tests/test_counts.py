@@ -0,0 +1,37 @@
+# pantry_tracker/webapp/tests/test_counts.py
+
+from sqlalchemy import event
+
+import app as pantry_app
+
+
+def add_products(add_product, first, last):
+    for index in range(first, last):
+        add_product(f"Counted product {index}", category="Counted")
+
+
+def count_queries(client, headers):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(pantry_app.engine, "before_cursor_execute", record)
+    try:
+        response = client.get("/counts", headers=headers)
+    finally:
+        event.remove(pantry_app.engine, "before_cursor_execute", record)
+    assert response.status_code == 200
+    return len(statements), response.get_json()
+
+
+def test_counts_query_count_does_not_grow_with_products(client, headers, add_product):
+    add_products(add_product, 0, 5)
+    few_queries, few_counts = count_queries(client, headers)
+
+    add_products(add_product, 5, 50)
+    many_queries, many_counts = count_queries(client, headers)
+
+    assert many_queries == few_queries
+    assert len(many_counts) - len(few_counts) == 45
+    assert many_counts["sensor.product_counted_product_49"] == 0
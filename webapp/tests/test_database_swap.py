@@ -0,0 +1,143 @@
+# pantry_tracker/webapp/tests/test_database_swap.py
+
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+
+import pytest
+
+import app as pantry_app
+from database import DatabaseBusy
+
+
+def update_count(client, headers, name):
+    response = client.post("/update_count", headers=headers, json={"product_name": name, "action": "increase"})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def in_thread(target):
+    """Run target in another thread, as a concurrent request would be, and return its result."""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(target()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def swapped_database(client, headers, first, second):
+    """Download the database and swap the names of two products, so each name gets the other's id."""
+    response = client.get("/download_db", headers=headers)
+    assert response.status_code == 200
+    fd, path = tempfile.mkstemp(suffix=".db")
+    with os.fdopen(fd, "wb") as f:
+        f.write(response.get_data())
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("UPDATE products SET name = 'swap placeholder' WHERE name = ?", (first,))
+        conn.execute("UPDATE products SET name = ? WHERE name = ?", (first, second))
+        conn.execute("UPDATE products SET name = ? WHERE name = 'swap placeholder'", (second,))
+    conn.close()
+    with open(path, "rb") as f:
+        data = f.read()
+    os.remove(path)
+    return data
+
+
+def upload(client, headers, data):
+    response = client.post("/upload_db", headers=headers, data={
+        "file": (io.BytesIO(data), "pantry_data.db"),
+    }, content_type="multipart/form-data")
+    assert response.status_code == 200, response.get_data(as_text=True)
+
+
+def test_upload_is_seen_as_soon_as_the_gate_reopens(client, headers, add_product, monkeypatch):
+    apple = add_product("Swap apple")
+    pear = add_product("Swap pear")
+    update_count(client, headers, apple)  # Caches the id of apple
+    etag = client.get("/counts", headers=headers).headers["ETag"]
+    data = swapped_database(client, headers, apple, pear)
+
+    # Requests arriving right after the swap, before the upload request has finished
+    seen = {}
+    record_database_reset = pantry_app.record_database_reset
+
+    def concurrent_requests():
+        seen["counts"] = in_thread(lambda: client.get("/counts", headers={**headers, "If-None-Match": etag}))
+        seen["update"] = in_thread(lambda: update_count(client, headers, apple))
+        return record_database_reset()
+
+    monkeypatch.setattr(pantry_app, "record_database_reset", concurrent_requests)
+    upload(client, headers, data)
+
+    # In the uploaded database apple has the id pear had, and its count row still says 1
+    assert seen["counts"].status_code == 200
+    assert seen["counts"].get_json()["sensor.product_swap_pear"] == 1
+    assert seen["update"]["count"] == 1
+    counts = client.get("/counts", headers=headers).get_json()
+    assert counts["sensor.product_swap_apple"] == 1
+    assert counts["sensor.product_swap_pear"] == 1
+
+
+def test_upload_tells_delta_clients_to_resync(client, headers, add_product):
+    name = add_product("Swap plum")
+    cursor = client.get("/counts/changes?since=1000000000", headers=headers).get_json()["cursor"]
+    update_count(client, headers, name)
+
+    response = client.get("/download_db", headers=headers)
+    upload(client, headers, response.get_data())
+
+    data = client.get(f"/counts/changes?since={cursor}", headers=headers).get_json()
+    assert data["resync"] is True
+
+
+def test_delete_database_empties_every_view(client, headers, add_product):
+    name = add_product("Swap cherry")
+    update_count(client, headers, name)
+    etags = {path: client.get(path, headers=headers).headers["ETag"] for path in ("/counts", "/products")}
+
+    response = client.delete("/delete_database", headers=headers)
+    assert response.status_code == 200
+
+    for path, etag in etags.items():
+        response = client.get(path, headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 200
+    assert client.get("/counts", headers=headers).get_json() == {}
+    response = client.post("/update_count", headers=headers, json={"product_name": name, "action": "increase"})
+    assert response.status_code == 404
+
+
+def test_swap_is_refused_while_another_is_running():
+    gate = pantry_app.database_gate
+
+    def second_swap():
+        with pytest.raises(DatabaseBusy):
+            with gate.exclusive(1):
+                pass
+        return gate.generation
+
+    with gate.exclusive(1):
+        assert in_thread(second_swap) % 2 == 1
+    assert gate.generation % 2 == 0
+
+
+def test_requests_wait_for_a_swap(client, headers, monkeypatch):
+    monkeypatch.setattr(pantry_app, "DATABASE_SWAP_WAIT", 0.1)
+    with pantry_app.database_gate.exclusive(1):
+        response = in_thread(lambda: client.get("/counts", headers=headers))
+    assert response.status_code == 503
+    assert response.headers["Retry-After"]
+    assert client.get("/counts", headers=headers).status_code == 200
+
+
+def test_gate_reopens_after_a_swapper_died(client, headers):
+    gate = pantry_app.database_gate
+    # What a process that died half way through exclusive() leaves behind: an odd
+    # generation, with its swap lock released by the kernel
+    gate._counters.increment("generation")
+    assert gate.generation % 2 == 1
+
+    assert client.get("/counts", headers=headers).status_code == 200
+    assert gate.generation % 2 == 0
@@ -0,0 +1,55 @@
+# pantry_tracker/webapp/tests/test_etag.py
+
+import pytest
+
+
+def update_count(client, headers, name, action="increase"):
+    response = client.post("/update_count", headers=headers, json={"product_name": name, "action": action})
+    assert response.status_code == 200
+    return response
+
+
+@pytest.mark.parametrize("path", ["/counts", "/products", "/categories"])
+def test_unchanged_data_is_not_modified(client, headers, add_product, path):
+    add_product(f"ETag cheese {path}")
+    first = client.get(path, headers=headers)
+    assert first.status_code == 200
+    assert first.headers["ETag"]
+
+    second = client.get(path, headers={**headers, "If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 304
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert second.get_data() == b""
+
+
+@pytest.mark.parametrize("path", ["/counts", "/products", "/categories"])
+def test_write_changes_the_etag(client, headers, add_product, path):
+    name = add_product(f"ETag bread {path}")
+    etag = client.get(path, headers=headers).headers["ETag"]
+
+    update_count(client, headers, name)
+
+    response = client.get(path, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_counts_body_follows_the_write(client, headers, add_product):
+    name = add_product("ETag butter")
+    update_count(client, headers, name)
+    etag = client.get("/counts", headers=headers).headers["ETag"]
+
+    update_count(client, headers, name)
+
+    response = client.get("/counts", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.get_json()["sensor.product_etag_butter"] == 2
+
+
+def test_failed_write_keeps_the_etag(client, headers):
+    etag = client.get("/counts", headers=headers).headers["ETag"]
+
+    response = client.post("/update_count", headers=headers, json={"product_name": "ETag missing", "action": "increase"})
+    assert response.status_code == 404
+
+    assert client.get("/counts", headers={**headers, "If-None-Match": etag}).status_code == 304
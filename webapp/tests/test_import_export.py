@@ -0,0 +1,84 @@
+# pantry_tracker/webapp/tests/test_import_export.py
+
+import io
+import csv
+import json
+
+CSV_HEADER = "name,url,category,barcode,image_front_small_url,count\n"
+
+
+def import_products(client, headers, body, query="format=csv", **kwargs):
+    return client.post(f"/products/import?{query}", headers=headers, data=body, **kwargs)
+
+
+def export_rows(client, headers, fmt):
+    response = client.get(f"/products/export?format={fmt}", headers=headers)
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    if fmt == "csv":
+        return {row["name"]: row for row in csv.DictReader(io.StringIO(text))}
+    return {row["name"]: row for row in map(json.loads, text.splitlines())}
+
+
+def test_csv_import_reports_invalid_rows(client, headers):
+    client.post("/categories", headers=headers, json={"name": "Imported"})
+    body = CSV_HEADER + (
+        "Import tea,https://example.com/tea.jpg,Imported,40000001,,3\n"
+        "Import tea,https://example.com/tea.jpg,Imported,,,1\n"
+        "Import coffee,https://example.com/coffee.jpg,Missing category,,,0\n"
+        "Import cocoa,not a url,Imported,,,0\n"
+    )
+
+    data = import_products(client, headers, body).get_json()
+    assert data["status"] == "partial"
+    assert data["imported"] == 1
+    assert [error["row"] for error in data["errors"]] == [3, 4, 5]
+
+    counts = client.get("/counts", headers=headers).get_json()
+    assert counts["sensor.product_import_tea"] == 3
+
+
+def test_ndjson_import_creates_categories(client, headers):
+    body = "\n".join(json.dumps(row) for row in [
+        {"name": "Import jam", "url": "https://example.com/jam.jpg", "category": "Imported spreads", "count": 2},
+        {"name": "Import honey", "url": "https://example.com/honey.jpg", "category": "Imported spreads"},
+    ])
+
+    data = import_products(client, headers, body, "format=ndjson&create_categories=true").get_json()
+    assert data["status"] == "ok"
+    assert data["imported"] == 2
+    assert data["created_categories"] == ["Imported spreads"]
+
+
+def test_multipart_import_detects_the_format(client, headers):
+    client.post("/categories", headers=headers, json={"name": "Imported"})
+    body = CSV_HEADER + "Import oats,https://example.com/oats.jpg,Imported,,,5\n"
+
+    response = client.post("/products/import", headers=headers, data={
+        "file": (io.BytesIO(body.encode()), "products.csv"),
+    }, content_type="multipart/form-data")
+    assert response.get_json()["imported"] == 1
+
+
+def test_unknown_format_is_rejected(client, headers):
+    assert import_products(client, headers, "x", "format=xml").status_code == 400
+    assert client.get("/products/export?format=xml", headers=headers).status_code == 400
+
+
+def test_export_round_trips(client, headers):
+    client.post("/categories", headers=headers, json={"name": "Imported"})
+    body = CSV_HEADER + "Import flour,https://example.com/flour.jpg,Imported,40000002,,7\n"
+    assert import_products(client, headers, body).get_json()["imported"] == 1
+
+    row = export_rows(client, headers, "csv")["Import flour"]
+    assert row == {
+        "name": "Import flour", "url": "https://example.com/flour.jpg", "category": "Imported",
+        "barcode": "40000002", "image_front_small_url": "", "count": "7",
+    }
+    assert export_rows(client, headers, "ndjson")["Import flour"]["count"] == 7
+
+    # Importing the export again only reports the existing products as duplicates
+    exported = client.get("/products/export?format=csv", headers=headers).get_data(as_text=True)
+    data = import_products(client, headers, exported).get_json()
+    assert data["imported"] == 0
+    assert {error["message"] for error in data["errors"]} == {"Duplicate product"}
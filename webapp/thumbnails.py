@@ -0,0 +1,252 @@
+# pantry_tracker/webapp/thumbnails.py
+
+import io
+import os
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "PantryManager/1.0.5 (mint@mintcreg.co.uk)"
+THUMBNAIL_QUALITY = 85
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+MAX_SOURCE_BYTES = 10 * 1024 * 1024  # Larger images are not downloaded
+FAILURE_RETRY_SECONDS = 600  # Seconds before a failed download of the same URL is tried again
+MAX_IMAGE_PIXELS = 40_000_000  # Larger images are refused before decoding (decompression bombs)
+
+
+class ImageUnavailable(Exception):
+    """Raised when an image cannot be downloaded or decoded and no thumbnail is cached."""
+
+
+def make_thumbnail(data, size):
+    """Decode an image, shrink it to fit within size x size pixels and return it as JPEG bytes."""
+    # Pillow is imported on first use so it does not slow down startup
+    from PIL import Image
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("RGB", (size, size))  # Lets JPEG decoding skip most of the full-size pixels
+        image.thumbnail((size, size))
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            # JPEG has no transparency, so flatten onto white like the table background
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+        return output.getvalue()
+
+
+class ThumbnailCache:
+    """
+    Resized copies of remote product images stored as JPEG files in cache_dir, named after
+    a hash of the source URL. Each image is downloaded once; after that it is served from
+    disk, also when the remote host cannot be reached.
+    The directory is kept under max_bytes by removing the least recently used thumbnails.
+    """
+
+    def __init__(self, cache_dir, size=160, max_bytes=50 * 1024 * 1024, timeout=5, prefetch_workers=2):
+        self.cache_dir = cache_dir
+        self.size = size
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.prefetch_workers = prefetch_workers
+        self.hits = 0
+        self.downloads = 0
+        self.failures = 0
+        self.evictions = 0
+        self._failed = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self._session = None
+        self._executor = None
+        self._pid = None
+
+    def _ensure_process_state(self):
+        # Sockets and threads must not be shared across fork(), so both are created per process.
+        # requests is imported here, on first use, to keep it out of startup.
+        if self._pid != os.getpid():
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=self.prefetch_workers + 4)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["User-Agent"] = USER_AGENT
+            self._session = session
+            self._executor = ThreadPoolExecutor(max_workers=self.prefetch_workers, thread_name_prefix="thumbnails")
+            self._pid = os.getpid()
+
+    @staticmethod
+    def key_for(url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+
+    def path_for(self, url):
+        return os.path.join(self.cache_dir, f"{self.key_for(url)}.jpg")
+
+    def _read(self, path):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # Mark the thumbnail as recently used; at most once an hour to avoid a write per hit
+        try:
+            if time.time() - os.stat(path).st_mtime > 3600:
+                os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def get(self, url):
+        """
+        Return the JPEG thumbnail for url, downloading and resizing the image if needed.
+        Concurrent requests for the same URL share a single download.
+        Raises ImageUnavailable if the image cannot be fetched.
+        """
+        path = self.path_for(url)
+        data = self._read(path)
+        if data is not None:
+            with self._lock:
+                self.hits += 1
+            return data
+
+        key = self.key_for(url)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                data = self._read(path)
+                if data is None:
+                    data = self._download(url, path)
+                else:
+                    with self._lock:
+                        self.hits += 1
+                return data
+        finally:
+            with self._lock:
+                self._key_locks.pop(key, None)
+
+    def prefetch(self, url):
+        """Download the thumbnail for url in the background unless it is already cached."""
+        if not url or not url.startswith(("http://", "https://")) or os.path.exists(self.path_for(url)):
+            return
+        self._ensure_process_state()
+        self._executor.submit(self._prefetch, url)
+
+    def _prefetch(self, url):
+        try:
+            self.get(url)
+        except ImageUnavailable as e:
+            logger.debug(f"Prefetching image {url} failed: {e}")
+        except Exception as e:
+            logger.error(f"Unexpected error prefetching image {url}: {e}")
+
+    def _download(self, url, path):
+        if not url.startswith(("http://", "https://")):
+            raise ImageUnavailable("Only http and https image URLs can be proxied.")
+        with self._lock:
+            failed_at = self._failed.get(url)
+        if failed_at is not None and time.monotonic() - failed_at < FAILURE_RETRY_SECONDS:
+            raise ImageUnavailable("The image failed to download recently.")
+
+        self._ensure_process_state()
+        try:
+            with self._session.get(url, timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                content_type = response.headers.get("Content-Type", "")
+                if content_type and not content_type.startswith("image/"):
+                    raise ImageUnavailable(f"Unexpected content type {content_type}.")
+                buffer = io.BytesIO()
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    buffer.write(chunk)
+                    if buffer.tell() > MAX_SOURCE_BYTES:
+                        raise ImageUnavailable("The image is too large.")
+            data = make_thumbnail(buffer.getvalue(), self.size)
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+                if len(self._failed) >= 1000:
+                    self._failed.clear()
+                self._failed[url] = time.monotonic()
+            logger.warning(f"Could not create a thumbnail for {url}: {e}")
+            if isinstance(e, ImageUnavailable):
+                raise
+            raise ImageUnavailable(str(e))
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write under a temporary name so other workers never read a partial file
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            self.downloads += 1
+            self._failed.pop(url, None)
+        logger.debug(f"Cached a {len(data)} byte thumbnail of {url}")
+        self.prune()
+        return data
+
+    def _entries(self):
+        try:
+            with os.scandir(self.cache_dir) as it:
+                return [
+                    (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                    for entry in it if entry.name.endswith(".jpg")
+                ]
+        except FileNotFoundError:
+            return []
+
+    def prune(self):
+        """Remove the least recently used thumbnails until the cache fits in max_bytes."""
+        if self.max_bytes <= 0:
+            return 0
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Already removed by another worker
+            total -= size
+            removed += 1
+        if removed:
+            with self._lock:
+                self.evictions += removed
+            logger.info(f"Removed {removed} least recently used thumbnails.")
+        return removed
+
+    def clear(self):
+        """Delete every cached thumbnail and return the number removed."""
+        removed = 0
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._failed.clear()
+        return removed
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "size": self.size,
+            "hits": self.hits,
+            "downloads": self.downloads,
+            "failures": self.failures,
+            "evictions": self.evictions,
+        }
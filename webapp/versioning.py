@@ -0,0 +1,42 @@
+# pantry_tracker/webapp/versioning.py
+
+import logging
+import mmap
+import multiprocessing
+import struct
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FORMAT = "I"  # Unsigned 32-bit so reads are atomic on 32-bit ARM as well
+COUNTER_SIZE = struct.calcsize(COUNTER_FORMAT)
+
+
+class SharedCounters:
+    """
+    Named counters kept in anonymous shared memory.
+    Worker processes forked after the counters are created (Gunicorn with
+    preload_app) all see the same values. Reads are a plain memory access,
+    so they are cheap enough to do on every request.
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self._offsets = {name: index * COUNTER_SIZE for index, name in enumerate(self.names)}
+        # An anonymous mapping is MAP_SHARED, so writes are visible across fork()
+        self._map = mmap.mmap(-1, len(self.names) * COUNTER_SIZE)
+        # Process-shared semaphore: serializes increments across workers and their threads
+        self._lock = multiprocessing.Lock()
+        logger.debug(f"Shared counters created: {', '.join(self.names)}")
+
+    def get(self, name):
+        return struct.unpack_from(COUNTER_FORMAT, self._map, self._offsets[name])[0]
+
+    def increment(self, *names):
+        """Increment one or more counters atomically and return their new values."""
+        with self._lock:
+            values = []
+            for name in names:
+                value = (self.get(name) + 1) & 0xFFFFFFFF
+                struct.pack_into(COUNTER_FORMAT, self._map, self._offsets[name], value)
+                values.append(value)
+            return values